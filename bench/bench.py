@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Dict, Optional, Union, Any, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+
+import cocktailsearch  # noqa: E402
+from fakeserver import FakeApiProcess, syntheticCatalog  # noqa: E402
+from resources.cache import ResponseCache  # noqa: E402
+from resources.catalog import Catalog  # noqa: E402
+from resources.thecocktaildb import Api  # noqa: E402
+
+MIXES = ('id', 'name', 'filter', 'mixed')  # input hint mixes
+# Api args and run options of each compared mode
+MODES = {'serial': {'maxWorkers': 1, 'memoSize': 0},
+         'concurrent': {'memoSize': 0},
+         'batch': {'prefetch': True},
+         'cached': {'prefetch': True, 'cache': True},
+         'offline': {'offline': True}}
+
+# typing reference
+DrinkInput = Dict[str, Optional[str]]
+
+
+def generateInputs(drinks: List[Dict[str, Optional[str]]], size: int, mix: str, seed: int = 0) -> List[DrinkInput]:
+    """
+    Creates input drinks picked from the served catalog, drinks may repeat like in real inputs
+    :param drinks: List[Dict[str, Optional[str]]] - served drink entries
+    :param size: int - number of input drinks
+    :param mix: str - id: idDrink only, name: strDrink only, filter: glass/alcoholic/ingredient, mixed: any of them
+    :param seed: int - random seed
+    :return: List[Dict[str, Optional[str]]] - input drink entries
+    """
+    rand = random.Random(seed)
+    inputs = []
+    for _ in range(size):
+        drink = rand.choice(drinks)
+        kind = rand.choice(MIXES[:3]) if mix == 'mixed' else mix
+        if kind == 'id':
+            inputs.append({'idDrink': drink['idDrink']})
+        elif kind == 'name':
+            inputs.append({'strDrink': drink['strDrink']})
+        else:
+            inputs.append({'strGlass': drink['strGlass'],
+                           'strAlcoholic': drink['strAlcoholic'],
+                           'strIngredient1': drink['strIngredient1']})
+    return inputs
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Gets the nearest rank percentile
+    :param values: List[float] - measured values
+    :param pct: float - percentile [0-100]
+    :return: float - percentile value, 0 if no values
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1)]
+
+
+def runMode(mode: str, inputs: List[DrinkInput], server: FakeApiProcess, workdir: str) -> Dict[str, Any]:
+    """
+    Searches every input drink with the given mode and measures it
+    :param mode: str - MODES key
+    :param inputs: List[Dict[str, Optional[str]]] - input drink entries
+    :param server: FakeApiProcess - running stand-in API, in its own process so peak memory is only the client's
+    :param workdir: str - folder for output, cache and catalog files
+    :return: Dict[str, Any] - measures of the run
+    """
+    options = dict(MODES[mode])
+    prefetch = options.pop('prefetch', False)
+    useCache = options.pop('cache', False)
+    offline = options.pop('offline', False)
+    cache = ResponseCache(os.path.join(workdir, mode + '.sqlite')) if useCache else None
+    catalog = None
+    if offline:
+        with Api(baseUrl=server.url) as api:
+            catalog = Catalog.sync(api)
+    if useCache:
+        # warm the cache with a first run, only the rerun is measured
+        with Api(baseUrl=server.url, cache=cache, **options) as api, \
+                cocktailsearch.OutputWriter(fpath=os.path.join(workdir, mode + '-warm.ndjson')) as writer:
+            searchAll(inputs, api, writer, prefetch)
+    server.resetCounters()
+    tracemalloc.start()
+    with Api(baseUrl=server.url, cache=cache, catalog=catalog, **options) as api, \
+            cocktailsearch.OutputWriter(fpath=os.path.join(workdir, mode + '.ndjson')) as writer:
+        start = time.perf_counter()
+        latencies, failures = searchAll(inputs, api, writer, prefetch)
+        elapsed = time.perf_counter() - start
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if cache is not None:
+        cache.close()
+    return {'mode': mode,
+            'drinks': len(inputs),
+            'seconds': round(elapsed, 3),
+            'drinksPerSecond': round(len(inputs) / elapsed, 1) if elapsed else 0,
+            'p50Ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99Ms': round(percentile(latencies, 99) * 1000, 2),
+            'httpCallsPerDrink': round(server.calls / len(inputs), 2) if inputs else 0,
+            'failures': failures,
+            'peakMemoryKB': round(peakMemory / 1024)}
+
+
+def searchAll(inputs: List[DrinkInput], api: Api, writer: cocktailsearch.OutputWriter,
+              prefetch: bool) -> Tuple[List[float], int]:
+    """
+    Searches every input drink and times each one
+    :param inputs: List[Dict[str, Optional[str]]] - input drink entries
+    :param api: Api - client used
+    :param writer: OutputWriter - run output
+    :param prefetch: bool - run the batch planner first, its time is spread over the drinks
+    :return: Tuple[List[float], int] - seconds of each drink search, number of drinks with an error
+    """
+    latencies = []
+    failures = 0
+    prefetchTime = 0.0
+    if prefetch:
+        start = time.perf_counter()
+        try:
+            cocktailsearch.prefetch(inputs, api)
+        except requests.exceptions.RequestException:
+            pass
+        prefetchTime = (time.perf_counter() - start) / max(1, len(inputs))
+    for drink in inputs:
+        start = time.perf_counter()
+        try:
+            cocktailsearch.search(drink, api=api, writer=writer)
+        # no results or injected error
+        except (TypeError, requests.exceptions.RequestException):
+            failures += 1
+        latencies.append(time.perf_counter() - start + prefetchTime)
+    return latencies, failures
+
+
+def printTable(results: List[Dict[str, Union[str, int, float]]]) -> None:
+    """
+    Prints run measures as a table
+    :param results: List[Dict[str, Union[str, int, float]]] - measures of each run
+    :return: None
+    """
+    columns = list(results[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print('  '.join(str(r[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main() -> None:
+    """
+    Benchmark driver, serves a fake API and compares the search modes on synthetic inputs
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks cocktail searches against a local stand-in API')
+    parser.add_argument('--catalog-size', type=int, default=500, help='number of synthetic drinks served')
+    parser.add_argument('--fixtures', help='catalog file (--sync-catalog output) served instead of synthetic drinks')
+    parser.add_argument('--sizes', default='50,200', help='comma separated number of input drinks')
+    parser.add_argument('--mixes', default=','.join(MIXES), help='comma separated hint mixes: ' + ', '.join(MIXES))
+    parser.add_argument('--modes', default=','.join(MODES), help='comma separated modes: ' + ', '.join(MODES))
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds added to each API response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of API responses failing')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of failing responses')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.fixtures:
+        # plain dicts, a binary catalog gives drink views the fake server cannot encode
+        drinks = [dict(d) for d in Catalog.load(args.fixtures).drinks]
+    else:
+        drinks = syntheticCatalog(args.catalog_size, args.seed)
+    results = []
+    with FakeApiProcess(drinks, args.latency, args.error_rate, args.error_status, seed=args.seed) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        for size in [int(x) for x in args.sizes.split(',')]:
+            for mix in args.mixes.split(','):
+                inputs = generateInputs(drinks, size, mix, args.seed)
+                for mode in args.modes.split(','):
+                    result = {'mix': mix}
+                    result.update(runMode(mode, inputs, server, workdir))
+                    results.append(result)
+    printTable(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing.connection import Connection
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# drink used as template of synthetic drinks
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'input.json')
+SHORT_KEYS = ('idDrink', 'strDrink', 'strDrinkThumb')  # attributes kept in filter.php results
+# list.php keys and the drink attribute each list holds
+LIST_KEYS = {'i': 'strIngredient1', 'a': 'strAlcoholic', 'c': 'strCategory', 'g': 'strGlass'}
+# filter.php keys and the drink attribute filtered
+FILTER_KEYS = {'a': 'strAlcoholic', 'c': 'strCategory', 'g': 'strGlass'}
+# synthetic drink values
+INGREDIENTS = ['Gin', 'Vodka', 'Light rum', 'Dark rum', 'Tequila', 'Brandy', 'Bourbon', 'Scotch', 'Triple sec',
+               'Lemon', 'Lime', 'Lemon juice', 'Lime juice', 'Orange juice', 'Cranberry juice', 'Sugar', 'Sugar syrup',
+               'Grenadine', 'Tonic water', 'Soda water', 'Cola', 'Mint', 'Angostura bitters', 'Cherry', 'Ice',
+               'Dry Vermouth', 'Sweet Vermouth', 'Campari', 'Coffee liqueur', 'Cream', 'Milk', 'Egg white', 'Salt',
+               'Pineapple juice', 'Coconut milk', 'Ginger ale', 'Amaretto', 'Kahlua', 'Peach schnapps', 'Champagne']
+CATEGORIES = ['Ordinary Drink', 'Cocktail', 'Shot', 'Punch / Party Drink', 'Coffee / Tea', 'Beer', 'Soft Drink']
+GLASSES = ['Cocktail glass', 'Highball glass', 'Old-fashioned glass', 'Collins glass', 'Shot glass', 'Whiskey sour glass',
+           'Champagne flute', 'Margarita glass', 'Coffee mug', 'Wine glass']
+ALCOHOLIC = ['Alcoholic', 'Alcoholic', 'Alcoholic', 'Non alcoholic', 'Optional alcohol']
+WORDS = ['Sour', 'Fizz', 'Sling', 'Punch', 'Smash', 'Julep', 'Martini', 'Collins', 'Mule', 'Spritz', 'Flip', 'Cooler',
+         'Blue', 'Red', 'Golden', 'Midnight', 'Tropical', 'Frozen', 'Royal', 'Dirty', 'Old', 'Classic', 'Spiced']
+
+# typing reference
+DrinkQueried = Dict[str, Optional[str]]
+
+
+def syntheticCatalog(size: int, seed: int = 0, templatePath: str = EXAMPLE_PATH) -> List[DrinkQueried]:
+    """
+    Creates a reproducible catalog of full drink entries shaped like the API responses
+    :param size: int - number of drinks
+    :param seed: int - random seed
+    :param templatePath: str - input file whose first drink gives the attributes not generated
+    :return: List[Dict[str, Optional[str]]] - full drink entries
+    """
+    with open(templatePath) as f:
+        template = json.load(f)['drinks'][0]
+    rand = random.Random(seed)
+    drinks = [dict(template)]
+    for i in range(1, size):
+        drink = dict(template)
+        drink['idDrink'] = str(20000 + i)
+        drink['strDrink'] = ' '.join(rand.sample(WORDS, 2)) + ' ' + str(i)
+        drink['strCategory'] = rand.choice(CATEGORIES)
+        drink['strGlass'] = rand.choice(GLASSES)
+        drink['strAlcoholic'] = rand.choice(ALCOHOLIC)
+        ingredients = rand.sample(INGREDIENTS, rand.randint(2, 6))
+        for n in range(1, 15 + 1):
+            drink['strIngredient' + str(n)] = ingredients[n - 1] if n <= len(ingredients) else None
+            drink['strMeasure' + str(n)] = '1 oz ' if n <= len(ingredients) else None
+        drinks.append(drink)
+    return drinks
+
+
+class FakeApiServer:
+    """
+    Local stand-in for TheCocktailDB API serving fixture drinks, with latency and error injection
+    """
+
+    def __init__(self, drinks: List[DrinkQueried], latency: float = 0.0, errorRate: float = 0.0,
+                 errorStatus: int = 503, multiIngredient: bool = True, port: int = 0, seed: int = 0) -> None:
+        """
+        FakeApiServer constructor
+        :param drinks: List[Dict[str, Optional[str]]] - full drink entries served
+        :param latency: float - seconds waited before each response
+        :param errorRate: float - fraction of requests answered with errorStatus
+        :param errorStatus: int - HTTP status of injected errors
+        :param multiIngredient: bool - support comma separated ingredients in filter.php?i= (premium key)
+        :param port: int - port listened, 0 for any free port
+        :param seed: int - random seed of error injection
+        """
+        self.drinks = drinks
+        self.latency = latency
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.multiIngredient = multiIngredient
+        self.calls = 0
+        self.bytesSent = 0
+        self._rand = random.Random(seed)
+        self._lock = threading.Lock()
+        self._byId = {d['idDrink']: d for d in drinks}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                status, body = server.respond(self.path)
+                body = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                return
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Gets the API URL to give to Api as baseUrl
+        :return: str - API URL
+        """
+        return 'http://127.0.0.1:' + str(self._httpd.server_address[1]) + '/api/json/v1/'
+
+    def __enter__(self) -> 'FakeApiServer':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Serves requests in a background thread
+        :return: None
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops serving requests
+        :return: None
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def resetCounters(self) -> None:
+        """
+        Resets the calls and bytes counters
+        :return: None
+        """
+        with self._lock:
+            self.calls = 0
+            self.bytesSent = 0
+
+    def respond(self, path: str) -> Tuple[int, str]:
+        """
+        Answers a request like the API
+        :param path: str - request path and query string
+        :return: Tuple[int, str] - HTTP status, JSON body
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            isError = self.errorRate and self._rand.random() < self.errorRate
+        if isError:
+            return self.errorStatus, ''
+        url = urlparse(path)
+        endpoint = url.path.rsplit('/', 1)[-1]
+        # repeated params keep the last value like the API
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        drinks = self.answer(endpoint, params)
+        body = json.dumps({'drinks': drinks or None})
+        with self._lock:
+            self.bytesSent += len(body)
+        return 200, body
+
+    def answer(self, endpoint: str, params: Dict[str, str]) -> List[DrinkQueried]:
+        """
+        Gets the drinks of an API endpoint
+        :param endpoint: str - lookup.php/search.php/filter.php/list.php
+        :param params: Dict[str, str] - query params
+        :return: List[Dict[str, Optional[str]]] - drink entries
+        """
+        if not params:
+            return []
+        key, value = next(iter(params.items()))
+        if endpoint == 'lookup.php':
+            return [self._byId[value]] if value in self._byId else []
+        if endpoint == 'search.php' and key == 's':
+            return [d for d in self.drinks if value.lower() in d['strDrink'].lower()]
+        if endpoint == 'search.php' and key == 'f':
+            return [d for d in self.drinks if d['strDrink'].lower().startswith(value.lower()[:1])]
+        if endpoint == 'filter.php' and key == 'i':
+            wanted = [x.strip().lower() for x in value.split(',')] if self.multiIngredient else [value.lower()]
+            drinks = [d for d in self.drinks if all(w in [(d['strIngredient' + str(n)] or '').lower()
+                                                          for n in range(1, 15 + 1)] for w in wanted)]
+            return [{k: d[k] for k in SHORT_KEYS} for d in drinks]
+        if endpoint == 'filter.php' and key in FILTER_KEYS:
+            drinks = [d for d in self.drinks if (d[FILTER_KEYS[key]] or '').lower() == value.lower()]
+            return [{k: d[k] for k in SHORT_KEYS} for d in drinks]
+        if endpoint == 'list.php' and key in LIST_KEYS:
+            if key == 'i':
+                values = sorted({d['strIngredient' + str(n)] for d in self.drinks for n in range(1, 15 + 1)} - {None})
+            else:
+                values = sorted({d[LIST_KEYS[key]] for d in self.drinks} - {None})
+            return [{LIST_KEYS[key]: x} for x in values]
+        return []
+
+
+def _serveProcess(conn: Connection, drinks: List[DrinkQueried], latency: float, errorRate: float, errorStatus: int,
+                  multiIngredient: bool, seed: int) -> None:
+    """
+    Child process of FakeApiProcess, serves until asked to stop and answers counter requests
+    :param conn: Connection - pipe end of the child
+    :param drinks: List[Dict[str, Optional[str]]] - full drink entries served
+    :param latency: float - seconds waited before each response
+    :param errorRate: float - fraction of requests answered with errorStatus
+    :param errorStatus: int - HTTP status of injected errors
+    :param multiIngredient: bool - support comma separated ingredients in filter.php?i=
+    :param seed: int - random seed of error injection
+    :return: None
+    """
+    with FakeApiServer(drinks, latency, errorRate, errorStatus, multiIngredient, seed=seed) as server:
+        conn.send(server.url)
+        while True:
+            try:
+                command = conn.recv()
+            # parent gone
+            except EOFError:
+                return
+            if command == 'calls':
+                conn.send(server.calls)
+            elif command == 'reset':
+                server.resetCounters()
+                conn.send(None)
+            else:
+                return
+
+
+class FakeApiProcess:
+    """
+    FakeApiServer run in a child process, so allocations measured in the benchmark process are only the client's
+    """
+
+    def __init__(self, drinks: List[DrinkQueried], latency: float = 0.0, errorRate: float = 0.0,
+                 errorStatus: int = 503, multiIngredient: bool = True, seed: int = 0) -> None:
+        """
+        FakeApiProcess constructor, same args as FakeApiServer
+        :param drinks: List[Dict[str, Optional[str]]] - full drink entries served
+        :param latency: float - seconds waited before each response
+        :param errorRate: float - fraction of requests answered with errorStatus
+        :param errorStatus: int - HTTP status of injected errors
+        :param multiIngredient: bool - support comma separated ingredients in filter.php?i= (premium key)
+        :param seed: int - random seed of error injection
+        """
+        self._args = (drinks, latency, errorRate, errorStatus, multiIngredient, seed)
+        self._process = None
+        self._conn = None
+        self.url = None
+
+    def __enter__(self) -> 'FakeApiProcess':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Starts the child process and waits until it serves requests
+        :return: None
+        """
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serveProcess, args=(child,) + self._args, daemon=True)
+        self._process.start()
+        child.close()
+        self.url = self._conn.recv()
+
+    def stop(self) -> None:
+        """
+        Stops serving requests and ends the child process
+        :return: None
+        """
+        self._conn.send('stop')
+        self._process.join()
+        self._conn.close()
+
+    @property
+    def calls(self) -> int:
+        """
+        Gets the number of requests received since the last reset
+        :return: int - requests received
+        """
+        self._conn.send('calls')
+        return self._conn.recv()
+
+    def resetCounters(self) -> None:
+        """
+        Resets the calls and bytes counters
+        :return: None
+        """
+        self._conn.send('reset')
+        self._conn.recv()
+
+
+if __name__ == '__main__':
+    # serve a synthetic catalog: fakeserver.py [port] [size]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    with FakeApiServer(syntheticCatalog(size), port=port) as fake:
+        print('Serving', size, 'drinks at', fake.url)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -1,13 +1,43 @@
 import datetime
 import json
-from typing import Dict, Union, List, Optional
+import os
+from operator import attrgetter, methodcaller
+from typing import Dict, Union, List, Optional, Tuple, Iterable, Callable, Any
 
-from resources.thecocktaildb import Cocktail, Api
+import requests
+
+from resources.pantry import PantryIndex
+from resources.stats import STATS
+from resources.thecocktaildb import Cocktail, Api, INGREDIENT_KEYS, MEASURE_KEYS, normalize
+
+OUTPUT_DIR = '../output/'  # output files folder
+OUTPUT_FORMATS = ('ndjson', 'array', 'files')  # OutputWriter modes
+DEFAULT_FLUSH_EVERY = 100  # results written between flushes
+
+# output key, getter and drink attributes needed of each formatted cocktail field, in output order
+# name/instructions translations and every other attribute only come with detail lookups
+OUTPUT_FIELDS = (('id', attrgetter('id'), ('idDrink',)),
+                 ('name', methodcaller('getNames'), ('strDrink',)),
+                 ('nameAlt', attrgetter('nameAlt'), ('strDrinkAlternate',)),
+                 ('category', attrgetter('category'), ('strCategory',)),
+                 ('iba', attrgetter('iba'), ('strIBA',)),
+                 ('tags', attrgetter('tags'), ('strTags',)),
+                 ('alcoholic', methodcaller('getIsAlcoholic'), ('strAlcoholic',)),
+                 ('glass', attrgetter('glass'), ('strGlass',)),
+                 ('instructions', methodcaller('getInstructions'), ('strInstructions',)),
+                 ('thumbnail', attrgetter('thumb'), ('strDrinkThumb',)),
+                 ('recipe', methodcaller('getRecipes'), INGREDIENT_KEYS + MEASURE_KEYS),
+                 ('imageAttribution', attrgetter('imgAttr'), ('strImageAttribution',)),
+                 ('video', attrgetter('video'), ('strVideo',)),
+                 ('imageSource', attrgetter('imgSrc'), ('strImageSource',)),
+                 ('creativeCommonsConfirmed', methodcaller('getIsCreativeCC'), ('strCreativeCommonsConfirmed',)),
+                 ('dateModified', methodcaller('getDate'), ('dateModified',)))
 
 # typing reference
 DrinkFormatted = Dict[str, Union[str, bool, Dict[str, str], List[Dict[str, str]]]]
 
 
+@STATS.timed('outputJSON')
 def outputJSON(drinkDict: Dict[str, List[DrinkFormatted]]) -> None:
     """
     Creates JSON file from dict given
@@ -17,12 +47,89 @@ def outputJSON(drinkDict: Dict[str, List[DrinkFormatted]]) -> None:
     # use date timestamp as unique identifier for file name
     date = datetime.datetime.now()
     date = date.strftime("%Y%m%d-%H%M%S%f")
-    fpath = '../output/output-' + date + '.json'
+    fpath = OUTPUT_DIR + 'output-' + date + '.json'
     with open(fpath, 'w') as f:
         json.dump(drinkDict, f, indent=4)
     return
 
 
+class OutputWriter:
+    """
+    Streams every search result of a run to a single output file
+    modes:
+        ndjson - one compact JSON result per line
+        array - JSON array of results, written incrementally
+        files - one timestamped file per result (outputJSON)
+    """
+
+    def __init__(self, mode: str = 'ndjson', fpath: str = None, flushEvery: int = DEFAULT_FLUSH_EVERY,
+                 echo: bool = False) -> None:
+        """
+        OutputWriter constructor, opens the output file
+        :param mode: str - ndjson/array/files
+        :param fpath: str - output file path, default timestamped file in the output folder (unused in files mode)
+        :param flushEvery: int - number of results written between flushes
+        :param echo: bool - also print each result as compact JSON
+        """
+        if mode not in OUTPUT_FORMATS:
+            raise ValueError('Unknown output format ' + mode)
+        self._mode = mode
+        self._flushEvery = max(1, flushEvery)
+        self._echo = echo
+        self._f = None
+        self.count = 0
+        if mode == 'files':
+            self.fpath = None
+            return
+        if fpath is None:
+            date = datetime.datetime.now().strftime("%Y%m%d-%H%M%S%f")
+            fpath = OUTPUT_DIR + 'output-' + date + ('.ndjson' if mode == 'ndjson' else '.json')
+        if os.path.dirname(fpath):
+            os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        self.fpath = fpath
+        self._f = open(fpath, 'w')
+        if mode == 'array':
+            self._f.write('[')
+
+    def __enter__(self) -> 'OutputWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @STATS.timed('OutputWriter.write')
+    def write(self, drinkDict: Dict[str, List[DrinkFormatted]]) -> None:
+        """
+        Writes a search result
+        :param drinkDict: Dict[str, List[Dict[str, Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]] - drink entries
+        :return: None
+        """
+        line = json.dumps(drinkDict, separators=(',', ':'))
+        if self._echo:
+            print(line)
+        if self._mode == 'files':
+            outputJSON(drinkDict)
+        elif self._mode == 'ndjson':
+            self._f.write(line + '\n')
+        else:
+            self._f.write((',\n' if self.count else '\n') + line)
+        self.count += 1
+        if self._f is not None and self.count % self._flushEvery == 0:
+            self._f.flush()
+
+    def close(self) -> None:
+        """
+        Ends and closes the output file
+        :return: None
+        """
+        if self._f is None:
+            return
+        if self._mode == 'array':
+            self._f.write('\n]\n')
+        self._f.close()
+        self._f = None
+
+
 def removeNone(drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]) -> None:
     """
     Iterates through dict and removes entries with None values in-place
@@ -35,7 +142,23 @@ def removeNone(drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], Li
     return
 
 
-def cocktailDictFormat(cocktails: List[Cocktail]) -> Dict[str, List[DrinkFormatted]]:
+def projectFields(fields: Iterable[str] = None) -> Tuple[Tuple[str, Callable[[Cocktail], Any], Tuple[str, ...]], ...]:
+    """
+    Gets the OUTPUT_FIELDS rows of given output keys, in output order
+    :param fields: Iterable[str] - output keys (id, name, thumbnail, ...), default all
+    :return: Tuple[Tuple[str, Callable, Tuple[str, ...]], ...] - OUTPUT_FIELDS rows
+    """
+    if fields is None:
+        return OUTPUT_FIELDS
+    fields = set(fields)
+    unknown = fields - set(key for key, _, _ in OUTPUT_FIELDS)
+    if unknown:
+        raise ValueError('Unknown output fields ' + ', '.join(sorted(unknown)))
+    return tuple(row for row in OUTPUT_FIELDS if row[0] in fields)
+
+
+@STATS.timed('cocktailDictFormat')
+def cocktailDictFormat(cocktails: List[Cocktail], fields: Iterable[str] = None) -> Dict[str, List[DrinkFormatted]]:
     """
     Create dict output from cocktail info with proper format
     format:
@@ -45,49 +168,143 @@ def cocktailDictFormat(cocktails: List[Cocktail]) -> Dict[str, List[DrinkFormatt
         date - ISO 8601 EST timezone
         string - if none of the above and not None
     :param cocktails: List[Cocktail] - List of cocktail objects
+    :param fields: Iterable[str] - output keys kept, default all
     :return: Dict[str, List[Dict[str, Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]] - dict of drink
     """
     output = {}
     drinks = []
+    rows = projectFields(fields)
     for drink in cocktails:
-        entry = {'id': drink.id,
-                 'name': drink.getNames(),
-                 'nameAlt': drink.nameAlt,
-                 'category': drink.category,
-                 'iba': drink.iba,
-                 'tags': drink.tags,
-                 'alcoholic': drink.getIsAlcoholic(),
-                 'glass': drink.glass,
-                 'instructions': drink.getInstructions(),
-                 'thumbnail': drink.thumb,
-                 'recipe': drink.getRecipes(),
-                 'imageAttribution': drink.imgAttr,
-                 'video': drink.video,
-                 'imageSource': drink.imgSrc,
-                 'creativeCommonsConfirmed': drink.getIsCreativeCC(),
-                 'dateModified': drink.getDate()
-                 }
-        removeNone(entry)
+        # single pass over the output fields, skipping None values
+        entry = {}
+        for key, getter, _ in rows:
+            value = getter(drink)
+            if value is not None:
+                entry[key] = value
         drinks.append(entry)
     output['drinks'] = drinks
-    print(json.dumps(output, indent=4))
     return output
 
 
-def search(drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]], keyStr: str = '1') -> None:
+@STATS.timed('prefetch')
+def prefetch(drinkDicts: List[Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]],
+             api: Api) -> int:
     """
-    Starts search query then creates final output
+    Batch planner, collects the API calls of every drink hints and runs each unique call once, concurrently
+    Results are remembered by api so the following searches of these drinks share them
+    :param drinkDicts: List[Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]] - drink entries
+    :param api: Api - shared API client
+    :return: int - number of unique calls made
+    """
+    calls = []
+    for drinkDict in drinkDicts:
+        try:
+            hints = Cocktail(drinkDict).getHint()
+        # not a drink entry, skipped when searched
+        except TypeError:
+            continue
+        calls.extend(api.planCalls(hints))
+    # dedupe calls, keeping first seen order
+    uniqueCalls = list(dict.fromkeys((s, k, tuple(p) if isinstance(p, list) else p) for s, k, p in calls))
+    uniqueCalls = [(s, k, list(p) if isinstance(p, tuple) else p) for s, k, p in uniqueCalls]
+    # drinks with no results or failing calls raise when searched
+    try:
+        api.queryMany(uniqueCalls, ignoreEmpty=True, prefetch=True)
+    except requests.exceptions.RetryError:
+        pass
+    return len(uniqueCalls)
+
+
+def searchDrink(drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]],
+                api: Api, fields: Iterable[str] = None, limit: int = None) -> Dict[str, List[DrinkFormatted]]:
+    """
+    Searches a drink and formats the results
     :param drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]] - drink entry
-    :param keyStr: str - API key, default "1"
-    :return: None
+    :param api: Api - shared API client
+    :param fields: Iterable[str] - output keys kept, default all. Detail lookups are skipped when not needed
+    :param limit: int - max number of drinks of the result, default all
+    :return: Dict[str, List[Dict[str, Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]] - dict of drink
     """
-    api = Api(keyStr)
     cocktail = Cocktail(drinkDict)
+    # drink attributes needed by the output fields
+    keys = None if fields is None else set(k for _, _, rowKeys in projectFields(fields) for k in rowKeys)
     # query API with cocktail object hints (ID/name/ingredients/alcoholic/category/glass)
-    cocktailQueries = api.query(cocktail.getHint())
+    cocktailQueries = api.query(cocktail.getHint(), keys, limit)
     cocktailList = [Cocktail(c) for c in cocktailQueries]
     # create cocktail in proper format
-    drinks = cocktailDictFormat(cocktailList)
+    return cocktailDictFormat(cocktailList, fields)
+
+
+def searchChunk(drinkDicts: List[Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]],
+                api: Api, fields: Iterable[str] = None,
+                limit: int = None) -> List[Tuple[str, Union[str, Dict[str, List[DrinkFormatted]]]]]:
+    """
+    Searches a chunk of drinks after prefetching their shared calls
+    Outcome of each drink, in order:
+        ("result", dict of drink) - formatted results
+        ("error", message) - no results found, entry not a drink or API unavailable after retries, drink skipped
+        ("abort", message) - HTTP error (bad key), last outcome of the chunk
+    :param drinkDicts: List[Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]] - drink entries
+    :param api: Api - shared API client
+    :param fields: Iterable[str] - output keys kept, default all
+    :param limit: int - max number of drinks of each result, default all
+    :return: List[Tuple[str, Union[str, Dict[str, List[DrinkFormatted]]]]] - outcomes
+    """
+    outcomes = []
+    try:
+        prefetch(drinkDicts, api)
+        for drinkDict in drinkDicts:
+            try:
+                outcomes.append(('result', searchDrink(drinkDict, api, fields, limit)))
+            # no results found or API unavailable after retries, try next drink
+            except (TypeError, requests.exceptions.RetryError) as e:
+                outcomes.append(('error', str(e)))
+    # HTTP error, bad key, stop
+    except requests.exceptions.HTTPError as e:
+        outcomes.append(('abort', str(e)))
+    return outcomes
+
+
+@STATS.timed('pantrySearch')
+def pantrySearch(index: PantryIndex, pantry: List[str], maxMissing: int = 0, fields: Iterable[str] = None,
+                 limit: int = None) -> Dict[str, List[DrinkFormatted]]:
+    """
+    Finds the drinks that can be made with the pantry ingredients and formats them
+    Drinks missing ingredients (up to maxMissing) list them under "missing"
+    :param index: PantryIndex - ingredient index of the local catalog
+    :param pantry: List[str] - ingredients at hand
+    :param maxMissing: int - max number of drink ingredients not in the pantry
+    :param fields: Iterable[str] - output keys kept, default all
+    :param limit: int - max number of drinks of the result, default all
+    :return: Dict[str, List[Dict[str, Union[str, bool, Dict[str, str], List[Dict[str, str]]]]]] - dict of drink
+    """
+    matches = index.query(pantry, maxMissing)[:limit]
+    output = cocktailDictFormat([Cocktail(drink) for drink, _ in matches], fields)
+    for entry, (drink, missing) in zip(output['drinks'], matches):
+        if missing:
+            # ingredient names as written in the drink
+            entry['missing'] = [ingr for ingr in dict.fromkeys(Cocktail(drink).ingredients)
+                                if ingr and normalize(ingr) in missing]
+    return output
+
+
+def search(drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]], keyStr: str = '1',
+           api: Api = None, writer: OutputWriter = None) -> None:
+    """
+    Starts search query then creates final output
+    :param drinkDict: Dict[str, Optional[Union[str, bool, Dict[str, str], List[Dict[str, str]]]]] - drink entry
+    :param keyStr: str - API key, default "1", only used if no api given
+    :param api: Api - shared API client (keeps its connections alive between searches), created if not given
+    :param writer: OutputWriter - run output, default one timestamped file per drink
+    :return: None
+    """
+    if api is None:
+        with Api(keyStr) as api:
+            return search(drinkDict, keyStr, api, writer)
+    drinks = searchDrink(drinkDict, api)
     # write to file
-    outputJSON(drinks)
+    if writer is None:
+        outputJSON(drinks)
+    else:
+        writer.write(drinks)
     return None
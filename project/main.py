@@ -1,9 +1,248 @@
+import argparse
+import atexit
+import cProfile
+import functools
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Iterator, Tuple, Union, Callable, Iterable, Any
 
 import requests
 
 import cocktailsearch
+from cocktailsearch import OUTPUT_DIR
 import json
+from resources.cache import ResponseCache, DEFAULT_CACHE_PATH
+from resources.catalog import Catalog, DEFAULT_CATALOG_PATH, DEFAULT_REFRESH_CHECKS
+from resources.jsonstream import iterDrinks
+from resources.pantry import PantryIndex
+from service import SearchService, DEFAULT_HOST
+from resources.stats import STATS
+from resources.thecocktaildb import Api, API_BASE_URL, DEFAULT_POOL_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_MAX_RETRIES
+
+DEFAULT_CHUNK_SIZE = 50  # drinks searched per task
+DEFAULT_INPUT_PATH = '../example/input.json'  # input file searched when no path given
+
+# typing reference
+Outcome = Tuple[str, Union[str, Dict[str, List[cocktailsearch.DrinkFormatted]]]]
+
+# client and cache of a worker process
+_workerApi = None
+_workerCache = None
+
+
+def parseArgs() -> argparse.Namespace:
+    """
+    Parses CLI args
+    :return: argparse.Namespace - parsed args
+    """
+    parser = argparse.ArgumentParser(description='Fetches cocktails from TheCocktailDB and outputs JSON files')
+    parser.add_argument('paths', nargs='*', default=[],
+                        help='input JSON files (or .ndjson/.jsonl, one drink per line), default example input unless '
+                             'only syncing or refreshing the catalog')
+    parser.add_argument('--output-format', choices=cocktailsearch.OUTPUT_FORMATS, default='ndjson',
+                        help='ndjson: one result per line, array: JSON array, files: one file per drink')
+    parser.add_argument('--output', help='output file, default timestamped file in the output folder')
+    parser.add_argument('--echo', action='store_true', help='also print each result')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the response cache')
+    parser.add_argument('--clear-cache', action='store_true', help='clear the response cache before searching')
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH, help='response cache file')
+    parser.add_argument('--fast-reject', action='store_true',
+                        help='skip drinks naming an ingredient, glass, category or alcoholic value missing from the '
+                             'API lists, or a non numeric id, without calling the API')
+    parser.add_argument('--sync-catalog', action='store_true', help='download the whole catalog to the local mirror')
+    parser.add_argument('--refresh-catalog', nargs='?', type=int, const=DEFAULT_REFRESH_CHECKS, metavar='N',
+                        help='revalidate the N least recently checked drinks of the local catalog (default %d), '
+                             'only changed drinks are replaced' % DEFAULT_REFRESH_CHECKS)
+    parser.add_argument('--offline', action='store_true', help='answer queries from the local catalog, no HTTP')
+    parser.add_argument('--catalog-path', default=DEFAULT_CATALOG_PATH, help='local catalog file')
+    parser.add_argument('--fields', type=lambda x: x.split(','), metavar='FIELD[,FIELD...]',
+                        help='output fields kept, e.g. id,name,thumbnail (default all), drink details are only '
+                             'fetched when needed')
+    parser.add_argument('--limit', type=int, help='max drinks per result (default all)')
+    parser.add_argument('--pantry', type=lambda x: x.split(','), metavar='INGREDIENT[,INGREDIENT...]',
+                        help='find the drinks of the local catalog that can be made with these ingredients instead of '
+                             'reading input files')
+    parser.add_argument('--missing', type=int, default=0,
+                        help='with --pantry, also find drinks missing up to N ingredients (default 0)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='search chunks of drinks in N processes, each with its own client (default in-process)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='drinks searched per task')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='run as a search service on local HTTP/JSON instead of reading input files')
+    parser.add_argument('--stats', nargs='?', const='-', metavar='PATH',
+                        help='print a JSON performance summary at the end of the run, or write it to PATH')
+    parser.add_argument('--profile', metavar='PATH', help='write cProfile stats of the run to PATH (pstats format)')
+    args = parser.parse_args()
+    try:
+        cocktailsearch.projectFields(args.fields)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.limit is not None and args.limit < 1:
+        parser.error('--limit must be at least 1')
+    if args.refresh_catalog is not None and args.refresh_catalog < 1:
+        parser.error('--refresh-catalog must be at least 1')
+    if args.missing < 0:
+        parser.error('--missing must be at least 0')
+    return args
+
+
+def initWorker(key: str, poolSize: int, maxWorkers: int, cachePath: Optional[str], catalogPath: Optional[str],
+               baseUrl: str, rateLimit: Optional[float], maxRetries: int, fastReject: bool, stats: bool) -> None:
+    """
+    Worker process initializer, creates the pooled client of the process
+    :param key: str - API key
+    :param poolSize: int - max number of connections kept alive
+    :param maxWorkers: int - max number of concurrent API calls
+    :param cachePath: str - response cache file, None to bypass the cache
+    :param catalogPath: str - local catalog file for offline mode, None to query the API
+    :param baseUrl: str - API URL
+    :param rateLimit: float - max API calls per second of the process (its share of the run limit), None for no limit
+    :param maxRetries: int - max retries of a throttled or failing call
+    :param fastReject: bool - reject unknown filter values and ids without calling the API
+    :param stats: bool - record performance stats, sent back with each chunk
+    :return: None
+    """
+    global _workerApi, _workerCache
+    STATS.enabled = stats
+    _workerCache = cache = ResponseCache(cachePath) if cachePath else None
+    catalog = Catalog.load(catalogPath) if catalogPath else None
+    _workerApi = Api(key, poolSize, maxWorkers, cache, catalog, baseUrl, rateLimit=rateLimit, maxRetries=maxRetries,
+                     fastReject=fastReject)
+    atexit.register(_workerApi.close)
+
+
+def searchChunkWorker(drinks: List[Dict[str, Optional[str]]], fields: List[str] = None,
+                      limit: int = None) -> Tuple[List[Outcome], int, int, Optional[Dict[str, Any]]]:
+    """
+    Searches a chunk of drinks with the client of the worker process
+    :param drinks: List[Dict[str, Optional[str]]] - drink entries
+    :param fields: List[str] - output keys kept, default all
+    :param limit: int - max number of drinks of each result, default all
+    :return: Tuple[List[Tuple[str, Union[str, Dict]]], int, int, int, Optional[Dict[str, Any]]] - outcome of each drink
+             (see cocktailsearch.searchChunk), API calls requested, saved and retried by the chunk, performance stats
+             and cache counters recorded by the chunk (mergeWorkerStats input), None if stats are not recorded
+    """
+    requested, saved, retries = _workerApi.callsRequested, _workerApi.callsSaved, _workerApi.retries
+    cacheCounts = None if _workerCache is None else _cacheCounters(_workerCache)
+    outcomes = cocktailsearch.searchChunk(drinks, _workerApi, fields, limit)
+    counters = None
+    if STATS.enabled:
+        counters = {'stats': STATS.drain()}
+        if cacheCounts is not None:
+            counters['cache'] = [x - y for x, y in zip(_cacheCounters(_workerCache), cacheCounts)]
+    return (outcomes, _workerApi.callsRequested - requested, _workerApi.callsSaved - saved,
+            _workerApi.retries - retries, counters)
+
+
+def _cacheCounters(cache: ResponseCache) -> List[int]:
+    """
+    Gets the hit/miss counters of a cache
+    :param cache: ResponseCache - cache
+    :return: List[int] - hits, misses, negative hits
+    """
+    return [cache.hits, cache.misses, cache.negativeHits]
+
+
+def mergeWorkerStats(counters: Optional[Dict[str, Any]], cache: Optional[ResponseCache]) -> None:
+    """
+    Adds the performance stats and cache counters recorded by a worker chunk to the run ones
+    :param counters: Dict[str, Any] - searchChunkWorker counters, None if not recorded
+    :param cache: ResponseCache - cache of the run, None if bypassed
+    :return: None
+    """
+    if counters is None:
+        return
+    STATS.merge(counters['stats'])
+    if cache is not None and 'cache' in counters:
+        hits, misses, negativeHits = counters['cache']
+        cache.hits += hits
+        cache.misses += misses
+        cache.negativeHits += negativeHits
+
+
+def chunks(paths: List[str], size: int) -> Iterator[List[Dict[str, Optional[str]]]]:
+    """
+    Streams drinks of every file as chunks, in input order
+    File errors are printed and the next file is read, drinks read before the error are kept
+    :param paths: List[str] - input file paths (JSON, or NDJSON with .ndjson/.jsonl extension)
+    :param size: int - max drinks per chunk
+    :return: Iterator[List[Dict[str, Optional[str]]]] - chunks of drink entries
+    """
+    size = max(1, size)
+    # loop through paths
+    for fpath in paths:
+        chunk = []
+        try:
+            for drink in iterDrinks(fpath):
+                chunk.append(drink)
+                if len(chunk) == size:
+                    yield chunk
+                    chunk = []
+        # File error, try next if available
+        except (json.decoder.JSONDecodeError, FileNotFoundError, KeyError) as e:
+            print('File error', fpath, e)
+        if chunk:
+            yield chunk
+
+
+def boundedMap(pool: ProcessPoolExecutor, func: Callable[[Any], Any], items: Iterable[Any],
+               window: int) -> Iterator[Any]:
+    """
+    Maps func over items in the pool like pool.map, with at most window items submitted at once
+    :param pool: ProcessPoolExecutor - worker processes
+    :param func: Callable - function to call on each item
+    :param items: Iterable - items, read as results are consumed
+    :param window: int - max items in flight
+    :return: Iterator - func results in items order
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def writeStats(path: str, api: Optional[Api], cache: Optional[ResponseCache]) -> None:
+    """
+    Prints or writes the run performance summary
+    :param path: str - JSON file path, "-" to print
+    :param api: Api - client of the run, None if no search client (pantry search)
+    :param cache: ResponseCache - cache of the run, None if bypassed
+    :return: None
+    """
+    summary = STATS.summary()
+    if api is not None:
+        summary['apiCalls'] = {'requested': api.callsRequested, 'savedByDeduplication': api.callsSaved,
+                               'retries': api.retries}
+    if cache is not None:
+        summary['cache'] = cache.stats()
+    if path == '-':
+        print(json.dumps(summary, indent=4))
+        return
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=4)
+
+
+def endRun(args: argparse.Namespace, profiler: Optional[cProfile.Profile], api: Optional[Api],
+           cache: Optional[ResponseCache]) -> None:
+    """
+    Ends every run mode: writes the profile and the performance summary if asked, closes the cache
+    :param args: argparse.Namespace - parsed args
+    :param profiler: cProfile.Profile - running profiler, None if not profiling
+    :param api: Api - client of the run, None if no search client
+    :param cache: ResponseCache - cache of the run, None if bypassed
+    :return: None
+    """
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if args.stats is not None:
+        writeStats(args.stats, api, cache)
+    if cache is not None:
+        cache.close()
 
 
 def main() -> None:
@@ -13,36 +252,132 @@ def main() -> None:
     else use default example
     :return: None
     """
+    args = parseArgs()
+    STATS.enabled = args.stats is not None
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
     # get API key from file
     try:
         with open('../project/resources/config.json') as f:
-            key = json.load(f)['API_KEY']
+            config = json.load(f)
+        key = config['API_KEY']
+        poolSize = config.get('POOL_SIZE', DEFAULT_POOL_SIZE)
+        maxWorkers = config.get('MAX_WORKERS', DEFAULT_MAX_WORKERS)
+        baseUrl = config.get('API_BASE_URL', API_BASE_URL)
+        rateLimit = config.get('RATE_LIMIT')
+        maxRetries = config.get('MAX_RETRIES', DEFAULT_MAX_RETRIES)
     except (json.decoder.JSONDecodeError, FileNotFoundError) as e:
-        print('File error in config.json', e.msg)
+        print('File error in config.json', e)
         sys.exit(1)
-    paths = sys.argv[1:] if len(sys.argv) > 1 else ['../example/input.json']
-    # loop through paths
-    for fpath in paths:
+    cache = None if args.no_cache else ResponseCache(args.cache_path)
+    if args.clear_cache:
+        if cache is None:
+            with ResponseCache(args.cache_path) as c:
+                c.clear()
+        else:
+            cache.clear()
+    catalog = None
+    if args.sync_catalog:
         try:
-            with open(fpath) as f:
-                # load json as dict
-                cInput = json.load(f)['drinks']
-                # loop through drinks in dict
-                for drink in cInput:
-                    try:
-                        cocktailsearch.search(drink, key)
-                    # no results found, try next drink if available
-                    except TypeError as e:
-                        print(e)
-                        continue
-        # File error, try next if available
-        except (json.decoder.JSONDecodeError, FileNotFoundError) as e:
-            print('File error', fpath, e.msg)
-            continue
-        # HTTP error, bad key, stop
-        except requests.exceptions.HTTPError as e_:
-            print(e_, 'with API key:', key)
+            with Api(key, poolSize, maxWorkers, cache, baseUrl=baseUrl, rateLimit=rateLimit,
+                     maxRetries=maxRetries) as api:
+                catalog = Catalog.sync(api)
+        except requests.exceptions.RequestException as e:
+            print(e, 'with API key:', key)
+            sys.exit(1)
+        catalog.save(args.catalog_path)
+        print('Catalog synced', len(catalog), 'drinks')
+    if (args.offline or args.pantry or args.refresh_catalog is not None) and catalog is None:
+        try:
+            catalog = Catalog.load(args.catalog_path)
+        except (json.decoder.JSONDecodeError, FileNotFoundError, KeyError) as e:
+            print('File error in catalog, run with --sync-catalog first', e)
+            sys.exit(1)
+    if args.refresh_catalog is not None:
+        try:
+            # lookups bypass the cache
+            with Api(key, poolSize, maxWorkers, baseUrl=baseUrl, rateLimit=rateLimit, maxRetries=maxRetries) as api:
+                counts = catalog.refresh(api, args.refresh_catalog)
+        except requests.exceptions.HTTPError as e:
+            print(e, 'with API key:', key)
             sys.exit(1)
+        catalog.save(args.catalog_path)
+        print('Catalog refreshed', counts['checked'], 'checked,', counts['updated'], 'updated,', counts['unchanged'],
+              'unchanged,', counts['missing'], 'missing')
+    # catalog maintenance only, no search
+    if (args.sync_catalog or args.refresh_catalog is not None) and not (args.paths or args.pantry or args.serve):
+        endRun(args, profiler, None, cache)
+        return
+    if args.pantry:
+        with cocktailsearch.OutputWriter(args.output_format, args.output, echo=args.echo) as writer:
+            writer.write(cocktailsearch.pantrySearch(PantryIndex(catalog.drinks), args.pantry, args.missing,
+                                                     args.fields, args.limit))
+        print(writer.count, 'results written to', writer.fpath or OUTPUT_DIR)
+        endRun(args, profiler, None, cache)
+        return
+    if not args.offline:
+        catalog = None
+    if args.serve:
+        host, _, port = args.serve.rpartition(':')
+        with Api(key, poolSize, maxWorkers, cache, catalog, baseUrl, rateLimit=rateLimit, maxRetries=maxRetries,
+                 fastReject=args.fast_reject) as api:
+            service = SearchService(api, cache, host or DEFAULT_HOST, int(port), fields=args.fields, limit=args.limit)
+            print('Serving on http://%s:%d (POST /search, GET /health, GET /stats)' % service.address)
+            try:
+                service.serve()
+            except KeyboardInterrupt:
+                service.shutdown()
+        endRun(args, profiler, api, cache)
+        return
+    # one pooled client shared by every drink of every file
+    with Api(key, poolSize, maxWorkers, cache, catalog, baseUrl, rateLimit=rateLimit, maxRetries=maxRetries,
+             fastReject=args.fast_reject) as api, \
+            cocktailsearch.OutputWriter(args.output_format, args.output, echo=args.echo) as writer:
+        # drinks are streamed by chunks, calls shared between drinks of a chunk are only made once
+        inputs = chunks(args.paths or [DEFAULT_INPUT_PATH], args.chunk_size)
+        if args.workers > 0:
+            # drinks are searched in worker processes, results merged back in input order
+            pool = ProcessPoolExecutor(args.workers, initializer=initWorker,
+                                       initargs=(key, poolSize, maxWorkers, None if cache is None else args.cache_path,
+                                                 args.catalog_path if args.offline else None, baseUrl,
+                                                 # the run limit is shared by the workers
+                                                 rateLimit / args.workers if rateLimit else None,
+                                                 maxRetries, args.fast_reject, STATS.enabled))
+            results = boundedMap(pool, functools.partial(searchChunkWorker, fields=args.fields, limit=args.limit),
+                                 inputs, 2 * args.workers)
+        else:
+            pool = None
+            # calls are counted by api
+            results = ((cocktailsearch.searchChunk(c, api, args.fields, args.limit), 0, 0, 0, None) for c in inputs)
+        callsRequested, callsSaved, retries = 0, 0, 0
+        for outcomes, requested, saved, retried, counters in results:
+            callsRequested += requested
+            callsSaved += saved
+            retries += retried
+            mergeWorkerStats(counters, cache)
+            for kind, value in outcomes:
+                if kind == 'result':
+                    writer.write(value)
+                # no results found, try next drink if available
+                elif kind == 'error':
+                    print(value)
+                # HTTP error, bad key, stop
+                else:
+                    print(value, 'with API key:', key)
+                    if pool is not None:
+                        pool.shutdown(cancel_futures=True)
+                    sys.exit(1)
+        if pool is not None:
+            pool.shutdown()
+        api.callsRequested += callsRequested
+        api.callsSaved += callsSaved
+        api.retries += retries
+        print('API calls:', api.callsRequested, 'requested,', api.callsSaved, 'saved by deduplication,', api.retries,
+              'retried')
+        print(writer.count, 'results written to', writer.fpath or OUTPUT_DIR)
+    endRun(args, profiler, api, cache)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,263 @@
+import array
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+from typing import List, Dict, Optional, Iterator, Iterable
+
+from resources.thecocktaildb import DrinkQueried, INGREDIENT_KEYS, INGREDIENT_SLOTS, LIST_KEYS, normalize
+
+# Layout (little endian), every string is stored once in the string table and referenced by its id:
+#     header - HEADER
+#     string offsets - (string count + 1) uint32, string i is bytes [offset i, offset i+1) of the string bytes
+#     string bytes - UTF-8
+#     keys - key count uint32 string ids, drink attributes in record order
+#     records - drink count x key count uint32 string ids (NONE if None), fixed width so drink i is found by offset
+#     ingredient ids - drink count x INGREDIENT_SLOTS uint32 string ids of the normalized ingredients, NONE after the
+#                      last one (same ingredients as drinkIngredients, in slot order)
+#     lists - for each LIST_KEYS key: value count uint32 then value string ids
+#     checked - drink count float64, epoch seconds of the last refresh check of each drink, 0 if never checked
+MAGIC = b'CKTLCAT2'  # file signature and format version
+NONE = 0xFFFFFFFF  # string id of None values
+# magic, key count, drink count, string count, synced string id, then offsets of the string offsets, string bytes,
+# keys, records, ingredient ids, lists and checked sections
+HEADER = struct.Struct('<8sIIIIQQQQQQQ')
+UINT = struct.Struct('<I')
+
+
+def writeBinary(path: str, drinks: Iterable[DrinkQueried], lists: Dict[str, List[str]] = None,
+                synced: str = None, checked: Dict[str, float] = None) -> None:
+    """
+    Writes drink entries to a binary catalog file, written then renamed so readers never see a partial file
+    :param path: str - binary catalog file path
+    :param drinks: Iterable[Dict[str, Optional[str]]] - full drink entries
+    :param lists: Dict[str, List[str]] - list.php values by key (i/a/c/g)
+    :param synced: str - ISO 8601 date of the download
+    :param checked: Dict[str, float] - epoch seconds of the last refresh check by idDrink
+    :return: None
+    """
+    strings = {}
+
+    def intern(value: Optional[str]) -> int:
+        return NONE if value is None else strings.setdefault(value, len(strings))
+
+    drinks = list(drinks)
+    # every attribute seen, in first seen order
+    keys = list(dict.fromkeys(k for drink in drinks for k in drink))
+    keyIds = [intern(k) for k in keys]
+    records = []
+    ingredients = []
+    for drink in drinks:
+        records.extend(intern(drink.get(k)) for k in keys)
+        ids = [intern(x) for x in _slotIngredients(drink)]
+        ingredients.extend(ids + [NONE] * (INGREDIENT_SLOTS - len(ids)))
+    listIds = []
+    for k in LIST_KEYS:
+        values = (lists or {}).get(k, [])
+        listIds.append(len(values))
+        listIds.extend(intern(x) for x in values)
+    syncedId = intern(synced)
+    blobs = [s.encode() for s in strings]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    # section offsets
+    stringOffsets = HEADER.size
+    stringBytes = stringOffsets + 4 * len(offsets)
+    keysAt = stringBytes + offsets[-1]
+    recordsAt = keysAt + 4 * len(keyIds)
+    ingredientsAt = recordsAt + 4 * len(records)
+    listsAt = ingredientsAt + 4 * len(ingredients)
+    checkedAt = listsAt + 4 * len(listIds)
+    checkedTimes = [(checked or {}).get(drink.get('idDrink'), 0.0) for drink in drinks]
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys), len(drinks), len(strings), syncedId, stringOffsets, stringBytes, keysAt,
+                            recordsAt, ingredientsAt, listsAt, checkedAt))
+        f.write(struct.pack('<%dI' % len(offsets), *offsets))
+        f.write(b''.join(blobs))
+        for ids in (keyIds, records, ingredients, listIds):
+            f.write(struct.pack('<%dI' % len(ids), *ids))
+        f.write(struct.pack('<%dd' % len(checkedTimes), *checkedTimes))
+    os.replace(path + '.tmp', path)
+
+
+def _slotIngredients(drink: DrinkQueried) -> List[str]:
+    """
+    Gets the normalized ingredients of a drink in slot order, same values as drinkIngredients
+    :param drink: Dict[str, Optional[str]] - full drink entry
+    :return: List[str] - normalized ingredients, without duplicates
+    """
+    output = {}
+    for key in INGREDIENT_KEYS:
+        ingr = drink.get(key)
+        if not ingr:
+            break
+        output[normalize(ingr)] = None
+    return list(output)
+
+
+class DrinkTable(Sequence):
+    """
+    Read only drink entries of a memory-mapped binary catalog file
+    Nothing is parsed when opened, drink entries are views decoding their strings when read, the pages are shared by
+    every process mapping the same file
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        DrinkTable constructor, maps the file
+        :param path: str - binary catalog file path
+        """
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # other file or older format version
+        if len(self._mm) < HEADER.size or self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError('Not a binary catalog file ' + path)
+        (_, self._keyCount, self._drinkCount, self._stringCount, syncedId, self._stringOffsets, self._stringBytes,
+         keysAt, self._recordsAt, self._ingredientsAt, self._listsAt, self._checkedAt) = HEADER.unpack_from(self._mm, 0)
+        self.keys = tuple(self.string(x) for x in struct.unpack_from('<%dI' % self._keyCount, self._mm, keysAt))
+        # record column of each attribute
+        self._columns = {k: i for i, k in enumerate(self.keys)}
+        self._recordSize = 4 * self._keyCount
+        self.synced = self.string(syncedId)
+
+    def __len__(self) -> int:
+        return self._drinkCount
+
+    def __getitem__(self, row: int) -> 'DrinkView':
+        if isinstance(row, slice):
+            return [DrinkView(self, i) for i in range(*row.indices(self._drinkCount))]
+        if row < 0:
+            row += self._drinkCount
+        if not 0 <= row < self._drinkCount:
+            raise IndexError('drink row out of range')
+        return DrinkView(self, row)
+
+    def close(self) -> None:
+        """
+        Unmaps the file, drink views can no longer be read
+        :return: None
+        """
+        self._mm.close()
+
+    def string(self, stringId: int) -> Optional[str]:
+        """
+        Decodes a string of the string table
+        :param stringId: int - string id
+        :return: str - string, None for NONE
+        """
+        if stringId == NONE:
+            return None
+        start, end = struct.unpack_from('<II', self._mm, self._stringOffsets + 4 * stringId)
+        return self._mm[self._stringBytes + start:self._stringBytes + end].decode()
+
+    def value(self, row: int, key: str) -> Optional[str]:
+        """
+        Reads an attribute of a drink
+        :param row: int - drink row
+        :param key: str - drink attribute
+        :return: str - attribute value, None if missing
+        """
+        column = self._columns.get(key)
+        if column is None:
+            return None
+        return self.string(UINT.unpack_from(self._mm, self._recordsAt + row * self._recordSize + 4 * column)[0])
+
+    def _uints(self, start: int, count: int) -> array.array:
+        """
+        Reads consecutive uint32 values
+        :param start: int - file offset
+        :param count: int - number of values
+        :return: array.array - values
+        """
+        values = array.array('I')
+        values.frombytes(self._mm[start:start + 4 * count])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def column(self, key: str) -> List[Optional[str]]:
+        """
+        Reads an attribute of every drink, each distinct string is decoded once
+        :param key: str - drink attribute
+        :return: List[Optional[str]] - attribute values, in row order
+        """
+        column = self._columns.get(key)
+        if column is None:
+            return [None] * self._drinkCount
+        ids = self._uints(self._recordsAt, self._drinkCount * self._keyCount)[column::self._keyCount]
+        strings = {NONE: None}
+        for stringId in set(ids):
+            if stringId not in strings:
+                strings[stringId] = self.string(stringId)
+        return [strings[x] for x in ids]
+
+    def ingredientIndex(self) -> Dict[str, List[int]]:
+        """
+        Builds the rows of each normalized ingredient from the precomputed ingredient ids, no drink is decoded
+        :return: Dict[str, List[int]] - drink rows by normalized ingredient, in row order
+        """
+        rows = {}
+        ids = self._uints(self._ingredientsAt, self._drinkCount * INGREDIENT_SLOTS)
+        for row in range(self._drinkCount):
+            for stringId in ids[row * INGREDIENT_SLOTS:(row + 1) * INGREDIENT_SLOTS]:
+                if stringId == NONE:
+                    break
+                rows.setdefault(stringId, []).append(row)
+        return {self.string(stringId): drinkRows for stringId, drinkRows in rows.items()}
+
+    def checked(self) -> Dict[str, float]:
+        """
+        Reads the last refresh check times
+        :return: Dict[str, float] - epoch seconds by idDrink, drinks never checked are left out
+        """
+        times = struct.unpack_from('<%dd' % self._drinkCount, self._mm, self._checkedAt)
+        return {id_: t for id_, t in zip(self.column('idDrink'), times) if t}
+
+    def lists(self) -> Dict[str, List[str]]:
+        """
+        Reads the list.php values
+        :return: Dict[str, List[str]] - values by key (i/a/c/g)
+        """
+        output = {}
+        at = self._listsAt
+        for k in LIST_KEYS:
+            count = UINT.unpack_from(self._mm, at)[0]
+            output[k] = [self.string(x) for x in struct.unpack_from('<%dI' % count, self._mm, at + 4)]
+            at += 4 + 4 * count
+        return output
+
+
+class DrinkView(Mapping):
+    """
+    Drink entry read from a DrinkTable on access, used like the drink dicts of API responses
+    """
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table: DrinkTable, row: int) -> None:
+        """
+        DrinkView constructor
+        :param table: DrinkTable - mapped catalog
+        :param row: int - drink row
+        """
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key: str) -> Optional[str]:
+        if key not in self._table._columns:
+            raise KeyError(key)
+        return self._table.value(self._row, key)
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self._table.value(self._row, key)
+        return default if value is None and key not in self._table._columns else value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.keys)
+
+    def __len__(self) -> int:
+        return len(self._table.keys)
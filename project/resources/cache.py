@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Optional, Union
+
+DEFAULT_CACHE_PATH = '../cache/responses.sqlite'  # cache file
+DEFAULT_MAX_ENTRIES = 50000  # max responses kept before evicting least recently used
+# time to live in seconds by endpoint, drink details rarely change
+DEFAULT_TTL = {'lookup': 30 * 24 * 3600,
+               'search': 24 * 3600,
+               'filter': 24 * 3600,
+               'list': 7 * 24 * 3600,
+               'capability': 7 * 24 * 3600}
+DEFAULT_NEGATIVE_TTL = 24 * 3600  # seconds a call with no results is answered from the cache
+
+# typing reference
+DrinkQueried = Dict[str, Optional[str]]
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of API responses with per endpoint TTL and LRU eviction
+    Calls with no results are kept apart (negative cache) with their own TTL
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: Dict[str, float] = None,
+                 maxEntries: int = DEFAULT_MAX_ENTRIES, negativeTtl: float = DEFAULT_NEGATIVE_TTL) -> None:
+        """
+        Cache constructor, creates the cache file if missing
+        :param path: str - SQLite file path
+        :param ttl: Dict[str, float] - seconds a response stays valid by searchType (lookup/search/filter/list)
+        :param maxEntries: int - max number of responses stored, and of calls with no results stored
+        :param negativeTtl: float - seconds a call with no results stays valid, 0 to disable the negative cache
+        """
+        self._ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self._maxEntries = maxEntries
+        self._negativeTtl = negativeTtl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negativeHits = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # shared by the Api worker threads, access is serialized with the lock
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, searchType TEXT, body TEXT, created REAL, accessed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT, created REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS negatives (key TEXT PRIMARY KEY, message TEXT, created REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS negatives_created ON negatives (created)')
+        self._size = self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        self._negativeSize = self._db.execute('SELECT COUNT(*) FROM negatives').fetchone()[0]
+
+    def __enter__(self) -> 'ResponseCache':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @staticmethod
+    def _makeKey(searchType: str, key: str, payload: Union[str, List[str]], source: str) -> str:
+        """
+        Creates the unique cache key of an API call
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :param source: str - API URL and key answering the call
+        :return: str - cache key
+        """
+        return json.dumps([source, searchType, key, payload])
+
+    def get(self, searchType: str, key: str, payload: Union[str, List[str]],
+            source: str = '') -> Optional[List[DrinkQueried]]:
+        """
+        Gets a stored response if not expired
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :param source: str - API URL and key answering the call, responses of other servers or keys are not shared
+        :return: List[Dict[str, Optional[str]]] - list of drink entry, None if not cached or expired
+        """
+        cacheKey = self._makeKey(searchType, key, payload, source)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT body, created FROM responses WHERE key = ?', (cacheKey,)).fetchone()
+            # missing or expired
+            if row is None or now - row[1] > self._ttl.get(searchType, 0):
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, cacheKey))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, searchType: str, key: str, payload: Union[str, List[str]], drinks: List[DrinkQueried],
+            source: str = '') -> None:
+        """
+        Stores a response, evicts least recently used responses when full
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :param drinks: List[Dict[str, Optional[str]]] - list of drink entry
+        :param source: str - API URL and key answering the call
+        :return: None
+        """
+        cacheKey = self._makeKey(searchType, key, payload, source)
+        now = time.time()
+        with self._lock:
+            # single statement, other processes may store the same call at the same time
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                             (cacheKey, searchType, json.dumps(drinks), now, now))
+            self._size += 1
+            if self._size > self._maxEntries:
+                self._size = self._evict('responses', 'accessed')
+
+    def getNegative(self, searchType: str, key: str, payload: Union[str, List[str]], source: str = '') -> Optional[str]:
+        """
+        Gets the error of a call stored with no results if not expired
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :param source: str - API URL and key answering the call
+        :return: str - error message of the call, None if not stored or expired
+        """
+        if not self._negativeTtl:
+            return None
+        cacheKey = self._makeKey(searchType, key, payload, source)
+        with self._lock:
+            row = self._db.execute('SELECT message, created FROM negatives WHERE key = ?', (cacheKey,)).fetchone()
+            if row is None or time.time() - row[1] > self._negativeTtl:
+                return None
+            self.negativeHits += 1
+        return row[0]
+
+    def setNegative(self, searchType: str, key: str, payload: Union[str, List[str]], message: str,
+                    source: str = '') -> None:
+        """
+        Stores a call with no results, evicts the oldest ones when full
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :param message: str - error message raised for the call
+        :param source: str - API URL and key answering the call
+        :return: None
+        """
+        if not self._negativeTtl:
+            return
+        cacheKey = self._makeKey(searchType, key, payload, source)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO negatives VALUES (?, ?, ?)', (cacheKey, message, time.time()))
+            self._negativeSize += 1
+            if self._negativeSize > self._maxEntries:
+                self._negativeSize = self._evict('negatives', 'created')
+
+    def _evict(self, table: str, order: str) -> int:
+        """
+        Removes the oldest entries of a table past maxEntries, the lock must be held
+        Entry counts are estimates (replaced entries and other processes sharing the file), the table is counted again
+        :param table: str - responses/negatives
+        :param order: str - column ordering entries, oldest first
+        :return: int - number of entries left
+        """
+        size = self._db.execute('SELECT COUNT(*) FROM ' + table).fetchone()[0]
+        if size > self._maxEntries:
+            self._db.execute('DELETE FROM ' + table + ' WHERE key IN (SELECT key FROM ' + table + ' ORDER BY ' + order +
+                             ' LIMIT ?)', (size - self._maxEntries,))
+            size = self._maxEntries
+        return size
+
+    def getMeta(self, name: str) -> Optional[str]:
+        """
+        Gets a stored value not about a response (API key capabilities), expires with the capability TTL
+        :param name: str - value name
+        :return: str - stored value, None if not stored or expired
+        """
+        with self._lock:
+            row = self._db.execute('SELECT value, created FROM meta WHERE key = ?', (name,)).fetchone()
+        if row is None or time.time() - row[1] > self._ttl['capability']:
+            return None
+        return row[0]
+
+    def setMeta(self, name: str, value: str) -> None:
+        """
+        Stores a value not about a response
+        :param name: str - value name
+        :param value: str - value
+        :return: None
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?, ?)', (name, value, time.time()))
+
+    def clear(self) -> None:
+        """
+        Removes every stored response, calls with no results and capabilities
+        :return: None
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._db.execute('DELETE FROM meta')
+            self._db.execute('DELETE FROM negatives')
+            self._size = 0
+            self._negativeSize = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets cache hit/miss counters
+        :return: Dict[str, int] - hits, misses and number of stored responses, hits and entries of the negative cache
+        """
+        with self._lock:
+            # counted from the file, shared with other processes
+            self._size = self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            self._negativeSize = self._db.execute('SELECT COUNT(*) FROM negatives').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self._size,
+                'negativeHits': self.negativeHits, 'negativeEntries': self._negativeSize}
+
+    def close(self) -> None:
+        """
+        Closes the cache file
+        :return: None
+        """
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,263 @@
+import datetime
+import hashlib
+import json
+import os
+import string
+import threading
+import time
+from typing import List, Dict, Optional, Union, Sequence, Iterable
+
+import requests
+
+from resources.binarycatalog import DrinkTable, writeBinary
+from resources.thecocktaildb import Api, DrinkQueried, LIST_KEYS, SHORT_KEYS, drinkIngredients, normalize
+
+DEFAULT_CATALOG_PATH = '../catalog/catalog.json'  # local catalog file
+BINARY_EXTENSION = '.bin'  # memory-mapped copy of the catalog file, loaded instead of parsing JSON
+DEFAULT_REFRESH_CHECKS = 100  # drinks revalidated per refresh
+DEFAULT_REFRESH_BATCH = 20  # lookups made at once while refreshing
+SYNC_LETTERS = string.ascii_lowercase + string.digits  # first letters walked with search.php?f=
+# filter.php keys and the drink attribute filtered
+FILTER_KEYS = {'a': 'strAlcoholic', 'c': 'strCategory', 'g': 'strGlass'}
+
+
+class Catalog:
+    """
+    Local mirror of the whole API catalog, answers queries from inverted indexes without HTTP
+    Indexes are built on the first query
+    """
+
+    def __init__(self, drinks: Sequence[DrinkQueried], lists: Dict[str, List[str]] = None, synced: str = None,
+                 checked: Dict[str, float] = None) -> None:
+        """
+        Catalog constructor
+        :param drinks: Sequence[Dict[str, Optional[str]]] - full drink entries, or a DrinkTable of a binary catalog file
+        :param lists: Dict[str, List[str]] - list.php values by key (i/a/c/g)
+        :param synced: str - ISO 8601 date of the download
+        :param checked: Dict[str, float] - epoch seconds of the last refresh check by idDrink
+        """
+        self.drinks = drinks
+        self.lists = lists or {}
+        self.synced = synced
+        self.checked = checked or {}
+        self._indexed = False
+        self._indexLock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.drinks)
+
+    def _buildIndexes(self) -> None:
+        """
+        Builds every index once (thread safe), indexes hold drink rows
+        Values are normalized like filterDrink matching
+        :return: None
+        """
+        if self._indexed:
+            return
+        with self._indexLock:
+            if self._indexed:
+                return
+            self._byId = {x: row for row, x in enumerate(self._column('idDrink'))}
+            self._byName = [normalize(x or '') for x in self._column('strDrink')]
+            self._byFirst = {}
+            for row, name in enumerate(self._byName):
+                self._byFirst.setdefault(name[:1], []).append(row)
+            self._byFilter = {k: {} for k in FILTER_KEYS}
+            for key, attr in FILTER_KEYS.items():
+                for row, value in enumerate(self._column(attr)):
+                    if value:
+                        self._byFilter[key].setdefault(normalize(value), []).append(row)
+            # normalized ingredients are precomputed in binary catalog files
+            if isinstance(self.drinks, DrinkTable):
+                self._byIngredient = self.drinks.ingredientIndex()
+            else:
+                self._byIngredient = {}
+                for row, drink in enumerate(self.drinks):
+                    for ingr in drinkIngredients(drink):
+                        self._byIngredient.setdefault(ingr, []).append(row)
+            self._indexed = True
+
+    def _column(self, key: str) -> List[Optional[str]]:
+        """
+        Gets an attribute of every drink
+        :param key: str - drink attribute
+        :return: List[Optional[str]] - attribute values, in drink order
+        """
+        if isinstance(self.drinks, DrinkTable):
+            return self.drinks.column(key)
+        return [d.get(key) for d in self.drinks]
+
+    @staticmethod
+    def _short(drinks: Iterable[DrinkQueried]) -> List[DrinkQueried]:
+        """
+        Shortens drink entries like filter.php results
+        :param drinks: Iterable[Dict[str, Optional[str]]] - full drink entries
+        :return: List[Dict[str, Optional[str]]] - drink entries with id, name and thumbnail
+        """
+        return [{k: d.get(k) for k in SHORT_KEYS} for d in drinks]
+
+    def _rows(self, rows: Iterable[int]) -> List[DrinkQueried]:
+        """
+        Gets the drinks of index rows
+        :param rows: Iterable[int] - drink rows
+        :return: List[Dict[str, Optional[str]]] - full drink entries
+        """
+        drinks = self.drinks
+        return [drinks[row] for row in rows]
+
+    def queryApi(self, searchType: str, key: str, payload: Union[str, List[str]]) -> List[DrinkQueried]:
+        """
+        Answers an API call from the indexes, same results and errors as Api.queryApi
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: str - param payload
+                        list - param payload (multi-ingredient filter)
+        :return: List[Dict[str, Optional[str]]] - list of drink entry
+        """
+        self._buildIndexes()
+        # values not strings (numbers) are matched as text, like the API params
+        payload = [str(x) for x in payload] if isinstance(payload, list) else str(payload)
+        output = []
+        if searchType == 'lookup':
+            row = self._byId.get(payload)
+            output = self._rows([row]) if row is not None else []
+        elif searchType == 'search' and key == 's':
+            name = normalize(payload)
+            output = self._rows(row for row, n in enumerate(self._byName) if name in n)
+        elif searchType == 'search' and key == 'f':
+            output = self._rows(self._byFirst.get(normalize(payload)[:1], []))
+        elif searchType == 'filter' and key == 'i':
+            ingredients = payload if isinstance(payload, list) else payload.split(',')
+            matches = [self._byIngredient.get(normalize(x.strip()), []) for x in ingredients]
+            common = set.intersection(*[set(m) for m in matches])
+            output = self._short(self._rows(row for row in matches[0] if row in common))
+        elif searchType == 'filter' and key in FILTER_KEYS:
+            output = self._short(self._rows(self._byFilter[key].get(normalize(payload), [])))
+        elif searchType == 'list' and key in LIST_KEYS:
+            output = [{LIST_KEYS[key]: x} for x in self.lists.get(key, [])]
+        # same errors as the API responses
+        if not output:
+            if searchType == 'filter':
+                raise TypeError('Query results 0 - Cannot retrieve information.')
+            raise TypeError('Query results 0 - Information does not exist in database.')
+        return output
+
+    @classmethod
+    def sync(cls, api: Api) -> 'Catalog':
+        """
+        Downloads the whole catalog by walking every first letter and the list endpoints
+        :param api: Api - client used to download
+        :return: Catalog - downloaded catalog
+        """
+        results = api.queryMany([('search', 'f', x) for x in SYNC_LETTERS], ignoreEmpty=True)
+        drinks = {}
+        for result in results:
+            for drink in result:
+                drinks.setdefault(drink['idDrink'], drink)
+        keys = list(LIST_KEYS)
+        lists = api.queryMany([('list', k, 'list') for k in keys], ignoreEmpty=True)
+        lists = {k: [x[LIST_KEYS[k]] for x in result] for k, result in zip(keys, lists)}
+        synced = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        # every drink was just downloaded
+        return cls(list(drinks.values()), lists, synced, dict.fromkeys(drinks, time.time()))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATALOG_PATH) -> 'Catalog':
+        """
+        Loads a catalog file, memory maps its binary copy instead when up to date (written if missing)
+        :param path: str - catalog file path
+        :return: Catalog - loaded catalog
+        """
+        binPath = binaryPath(path)
+        if os.path.exists(binPath) and (not os.path.exists(path) or
+                                        os.path.getmtime(binPath) >= os.path.getmtime(path)):
+            try:
+                table = DrinkTable(binPath)
+                return cls(table, table.lists(), table.synced, table.checked())
+            # older format, written again from the JSON
+            except ValueError:
+                pass
+        with open(path) as f:
+            data = json.load(f)
+        # next loads skip parsing JSON
+        try:
+            writeBinary(binPath, data['drinks'], data.get('lists'), data.get('synced'), data.get('checked'))
+        except OSError:
+            pass
+        return cls(data['drinks'], data.get('lists'), data.get('synced'), data.get('checked'))
+
+    def save(self, path: str = DEFAULT_CATALOG_PATH) -> None:
+        """
+        Writes the catalog to file, and its binary copy
+        :param path: str - catalog file path
+        :return: None
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        drinks = [dict(d) for d in self.drinks] if isinstance(self.drinks, DrinkTable) else self.drinks
+        # write then rename so a failed sync keeps the previous catalog
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'synced': self.synced, 'lists': self.lists, 'checked': self.checked, 'drinks': drinks}, f)
+        os.replace(path + '.tmp', path)
+        writeBinary(binaryPath(path), drinks, self.lists, self.synced, self.checked)
+
+    def refresh(self, api: Api, maxChecks: int = DEFAULT_REFRESH_CHECKS,
+                batchSize: int = DEFAULT_REFRESH_BATCH) -> Dict[str, int]:
+        """
+        Revalidates stored drinks with their detail lookups, in batches of concurrent calls
+        Drinks never or least recently checked come first, then the most recently modified
+        Only drinks whose dateModified or content changed are replaced, call save() to write them
+        :param api: Api - client used, should bypass the response cache
+        :param maxChecks: int - max number of drinks checked, None for all
+        :param batchSize: int - lookups made at once
+        :return: Dict[str, int] - number of drinks checked, updated, unchanged and missing (no longer found, kept)
+        """
+        drinks = [dict(d) for d in self.drinks] if isinstance(self.drinks, DrinkTable) else list(self.drinks)
+        # "YYYY-MM-DD HH:MM:SS" dates sort as strings, stable sorts keep the most recently modified first on ties
+        rows = sorted(range(len(drinks)), key=lambda r: drinks[r].get('dateModified') or '', reverse=True)
+        rows.sort(key=lambda r: self.checked.get(drinks[r]['idDrink'], 0.0))
+        rows = rows[:maxChecks]
+        counts = {'checked': 0, 'updated': 0, 'unchanged': 0, 'missing': 0}
+        batchSize = max(1, batchSize)
+        for start in range(0, len(rows), batchSize):
+            batch = rows[start:start + batchSize]
+            try:
+                results = api.queryMany([('lookup', 'i', drinks[r]['idDrink']) for r in batch], ignoreEmpty=True)
+            # API unavailable, keep the drinks checked so far
+            except requests.exceptions.RetryError:
+                break
+            now = time.time()
+            for row, result in zip(batch, results):
+                counts['checked'] += 1
+                self.checked[drinks[row]['idDrink']] = now
+                if not result:
+                    counts['missing'] += 1
+                elif (result[0].get('dateModified') != drinks[row].get('dateModified') or
+                      contentHash(result[0]) != contentHash(drinks[row])):
+                    drinks[row] = result[0]
+                    counts['updated'] += 1
+                else:
+                    counts['unchanged'] += 1
+        if counts['updated']:
+            with self._indexLock:
+                self.drinks = drinks
+                self._indexed = False
+        return counts
+
+
+def contentHash(drink: DrinkQueried) -> str:
+    """
+    Gets a hash of every attribute of a drink
+    :param drink: Dict[str, Optional[str]] - full drink entry
+    :return: str - hex digest
+    """
+    return hashlib.sha1(json.dumps(dict(drink), sort_keys=True).encode()).hexdigest()
+
+
+def binaryPath(path: str) -> str:
+    """
+    Gets the binary copy path of a catalog file
+    :param path: str - catalog file path
+    :return: str - binary catalog file path
+    """
+    return os.path.splitext(path)[0] + BINARY_EXTENSION
@@ -0,0 +1,127 @@
+import json
+from typing import Dict, Iterator, Optional, TextIO, Any
+
+READ_SIZE = 65536  # characters read at once
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')  # files read as one drink entry per line
+NUMBER_CHARS = '0123456789.eE+-'  # characters a JSON number may continue with
+
+# typing reference
+DrinkInput = Dict[str, Optional[str]]
+
+
+class _StreamParser:
+    """
+    Incremental parser of a JSON document, only the current value is kept in memory
+    """
+
+    def __init__(self, f: TextIO) -> None:
+        """
+        _StreamParser constructor
+        :param f: TextIO - opened file
+        """
+        self._f = f
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _read(self) -> bool:
+        """
+        Reads more characters, drops the ones already parsed
+        :return: bool - False if end of file
+        """
+        if self._eof:
+            return False
+        data = self._f.read(READ_SIZE)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skips whitespace and gets the next character without consuming it
+        :return: str - next character, "" if end of file
+        """
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """
+        Consumes the next character, which must be one of chars
+        :param chars: str - allowed characters
+        :return: str - consumed character
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.decoder.JSONDecodeError('Expecting one of ' + repr(chars), self._buf, self._pos)
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """
+        Parses the next JSON value
+        :return: Any - parsed value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a value ending the buffer may continue (numbers, literals), as a number followed by the rest of its
+                # digits, fraction or exponent once more is read ("12." of "12.5")
+                if self._eof or (end < len(self._buf) and not (isinstance(value, (int, float)) and
+                                                               self._buf[end] in NUMBER_CHARS)):
+                    self._pos = end
+                    return value
+            except json.decoder.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read()
+
+
+def iterDrinks(fpath: str) -> Iterator[DrinkInput]:
+    """
+    Yields drink entries of an input file one at a time, with bounded memory whatever the file size
+    Formats:
+        {"drinks": [{...}, {...}]} - JSON input file
+        one drink entry per line - .ndjson/.jsonl files
+    :param fpath: str - input file path
+    :return: Iterator[Dict[str, Optional[str]]] - drink entries, in file order
+    """
+    with open(fpath) as f:
+        if fpath.endswith(NDJSON_EXTENSIONS):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        parser = _StreamParser(f)
+        parser.expect('{')
+        found = False
+        if parser.peek() != '}':
+            while True:
+                key = parser.value()
+                parser.expect(':')
+                if key == 'drinks' and not found:
+                    found = True
+                    parser.expect('[')
+                    if parser.peek() != ']':
+                        while True:
+                            yield parser.value()
+                            if parser.expect(',]') == ']':
+                                break
+                    else:
+                        parser.expect(']')
+                # other keys are skipped
+                else:
+                    parser.value()
+                if parser.expect(',}') == '}':
+                    break
+        if not found:
+            raise KeyError('drinks')
@@ -0,0 +1,104 @@
+from typing import List, Iterable, Tuple
+
+from resources.binarycatalog import DrinkTable
+from resources.thecocktaildb import DrinkQueried, drinkIngredients, normalize
+
+# optional, vectorizes queries over large catalogs
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PantryIndex:
+    """
+    Drinks x ingredients bitset index of a catalog snapshot, answers "what can I make" queries without HTTP
+    Each drink is a bitmask of its normalized ingredients (a bool matrix if numpy is installed)
+    """
+
+    def __init__(self, drinks: Iterable[DrinkQueried]) -> None:
+        """
+        PantryIndex constructor, builds the masks, drinks with no ingredients are left out
+        :param drinks: Iterable[Dict[str, Optional[str]]] - full drink entries (Catalog.drinks), the normalized
+                       ingredients of a DrinkTable are read from its precomputed ids without decoding any drink
+        """
+        # normalized ingredients of each drink, read once
+        if isinstance(drinks, DrinkTable):
+            ingredients = [[] for _ in range(len(drinks))]
+            for ingr, rows in drinks.ingredientIndex().items():
+                for row in rows:
+                    ingredients[row].append(ingr)
+        else:
+            drinks = list(drinks)
+            ingredients = [drinkIngredients(drink) for drink in drinks]
+        self.drinks = []
+        # bit of each normalized ingredient
+        self._bits = {}
+        self._masks = []
+        kept = []
+        for row, drinkIngr in enumerate(ingredients):
+            if not drinkIngr:
+                continue
+            mask = 0
+            for ingr in drinkIngr:
+                mask |= 1 << self._bits.setdefault(ingr, len(self._bits))
+            self.drinks.append(drinks[row])
+            self._masks.append(mask)
+            kept.append(drinkIngr)
+        self._names = sorted(self._bits, key=self._bits.get)
+        self._matrix = None
+        if numpy is not None and self.drinks:
+            self._matrix = numpy.zeros((len(self.drinks), len(self._bits)), dtype=bool)
+            for row, drinkIngr in enumerate(kept):
+                self._matrix[row, [self._bits[ingr] for ingr in drinkIngr]] = True
+
+    def __len__(self) -> int:
+        return len(self.drinks)
+
+    def query(self, pantry: Iterable[str], maxMissing: int = 0) -> List[Tuple[DrinkQueried, List[str]]]:
+        """
+        Finds drinks whose ingredients are all in the pantry, or all but maxMissing of them
+        :param pantry: Iterable[str] - ingredients at hand, matched case insensitively, unknown ones are ignored
+        :param maxMissing: int - max number of drink ingredients not in the pantry
+        :return: List[Tuple[Dict[str, Optional[str]], List[str]]] - drink entry and its normalized missing ingredients,
+                                                                  fewest missing first then catalog order
+        """
+        have = 0
+        for ingr in pantry:
+            bit = self._bits.get(normalize(ingr.strip()))
+            if bit is not None:
+                have |= 1 << bit
+        if self._matrix is not None:
+            rows = self._queryMatrix(have, maxMissing)
+        else:
+            rows = []
+            for row, mask in enumerate(self._masks):
+                missing = bin(mask & ~have).count('1')
+                if missing <= maxMissing:
+                    rows.append((missing, row))
+        rows.sort()
+        return [(self.drinks[row], self._missing(self._masks[row] & ~have)) for _, row in rows]
+
+    def _queryMatrix(self, have: int, maxMissing: int) -> List[Tuple[int, int]]:
+        """
+        Counts missing ingredients of every drink at once with the bool matrix
+        :param have: int - pantry bitmask
+        :param maxMissing: int - max number of drink ingredients not in the pantry
+        :return: List[Tuple[int, int]] - missing count and row of each matching drink
+        """
+        lacking = numpy.array([not (have >> bit) & 1 for bit in range(len(self._bits))], dtype=bool)
+        counts = self._matrix[:, lacking].sum(axis=1)
+        return [(int(counts[row]), int(row)) for row in numpy.flatnonzero(counts <= maxMissing)]
+
+    def _missing(self, mask: int) -> List[str]:
+        """
+        Gets the normalized ingredients of a bitmask
+        :param mask: int - ingredients bitmask
+        :return: List[str] - normalized ingredients, in bit order
+        """
+        output = []
+        while mask:
+            low = mask & -mask
+            output.append(self._names[low.bit_length() - 1])
+            mask ^= low
+        return output
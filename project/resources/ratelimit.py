@@ -0,0 +1,99 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, calls wait for a token before running
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        TokenBucket constructor
+        :param rate: float - tokens added per second (sustained calls per second)
+        :param burst: int - max tokens stored (calls allowed at once after being idle)
+        """
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Waits until a token is available and takes it
+        :return: None
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of calls running at once, the cap is halved when throttled and slowly raised back on success
+    (additive increase, multiplicative decrease)
+    """
+
+    def __init__(self, maxLimit: int, minLimit: int = 1) -> None:
+        """
+        AdaptiveLimiter constructor
+        :param maxLimit: int - max calls running at once, starting cap
+        :param minLimit: int - cap never goes lower
+        """
+        self._maxLimit = max(1, maxLimit)
+        self._minLimit = max(1, min(minLimit, self._maxLimit))
+        self.limit = float(self._maxLimit)
+        self._running = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> 'AdaptiveLimiter':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def acquire(self) -> None:
+        """
+        Waits until running calls are under the cap
+        :return: None
+        """
+        with self._cond:
+            while self._running >= int(self.limit):
+                self._cond.wait()
+            self._running += 1
+
+    def release(self) -> None:
+        """
+        Marks a call as done
+        :return: None
+        """
+        with self._cond:
+            self._running -= 1
+            self._cond.notify()
+
+    def onSuccess(self) -> None:
+        """
+        Raises the cap by one every cap successful calls
+        :return: None
+        """
+        with self._cond:
+            if self.limit < self._maxLimit:
+                self.limit = min(self._maxLimit, self.limit + 1 / self.limit)
+                self._cond.notify_all()
+
+    def onThrottle(self) -> None:
+        """
+        Halves the cap
+        :return: None
+        """
+        with self._cond:
+            self.limit = max(self._minLimit, self.limit / 2)
@@ -0,0 +1,146 @@
+import functools
+import threading
+import time
+from typing import Dict, Callable, Any, Union, List
+
+
+class RunStats:
+    """
+    Collects timings, call counts, bytes received and result cardinalities of a run
+    Recording is off until enabled, hooks then only cost a flag check
+    """
+
+    def __init__(self) -> None:
+        """
+        RunStats constructor
+        """
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clears every recorded value
+        :return: None
+        """
+        with self._lock:
+            # name: [calls, total seconds, max seconds]
+            self._timers = {}
+            # endpoint: [calls, bytes received]
+            self._endpoints = {}
+            # name: [results, total cardinality, max cardinality]
+            self._cardinalities = {}
+            self._start = time.perf_counter()
+
+    def timed(self, name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """
+        Decorator recording the time spent in a function
+        :param name: str - timer name
+        :return: Callable - decorator
+        """
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs) -> Any:
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.addTime(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def addTime(self, name: str, seconds: float) -> None:
+        """
+        Records a timing
+        :param name: str - timer name
+        :param seconds: float - time spent
+        :return: None
+        """
+        with self._lock:
+            timer = self._timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def addCall(self, endpoint: str, nbytes: int) -> None:
+        """
+        Records an HTTP call
+        :param endpoint: str - endpoint called (lookup/search/filter/list)
+        :param nbytes: int - response body size
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            calls = self._endpoints.setdefault(endpoint, [0, 0])
+            calls[0] += 1
+            calls[1] += nbytes
+
+    def addCardinality(self, name: str, count: int) -> None:
+        """
+        Records the number of results of a step
+        :param name: str - step name
+        :param count: int - number of results
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            card = self._cardinalities.setdefault(name, [0, 0, 0])
+            card[0] += 1
+            card[1] += count
+            card[2] = max(card[2], count)
+
+    def drain(self) -> Dict[str, Dict[str, List[Union[int, float]]]]:
+        """
+        Gets the values recorded since the last drain and clears them, to be merged in the stats of another process
+        :return: Dict[str, Dict[str, List[Union[int, float]]]] - raw timers, HTTP calls and cardinalities
+        """
+        with self._lock:
+            raw = {'timers': self._timers, 'endpoints': self._endpoints, 'cardinalities': self._cardinalities}
+            self._timers, self._endpoints, self._cardinalities = {}, {}, {}
+        return raw
+
+    def merge(self, raw: Dict[str, Dict[str, List[Union[int, float]]]]) -> None:
+        """
+        Adds values recorded by another process (worker)
+        :param raw: Dict[str, Dict[str, List[Union[int, float]]]] - drain() output of the other process
+        :return: None
+        """
+        with self._lock:
+            for name, (calls, total, peak) in raw['timers'].items():
+                timer = self._timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += calls
+                timer[1] += total
+                timer[2] = max(timer[2], peak)
+            for endpoint, (calls, nbytes) in raw['endpoints'].items():
+                counts = self._endpoints.setdefault(endpoint, [0, 0])
+                counts[0] += calls
+                counts[1] += nbytes
+            for name, (results, total, peak) in raw['cardinalities'].items():
+                card = self._cardinalities.setdefault(name, [0, 0, 0])
+                card[0] += results
+                card[1] += total
+                card[2] = max(card[2], peak)
+
+    def summary(self) -> Dict[str, Union[float, Dict[str, Dict[str, Union[int, float]]]]]:
+        """
+        Gets the recorded values
+        :return: Dict - wall time, timers, HTTP calls by endpoint and cardinalities
+        """
+        with self._lock:
+            return {'wallSeconds': round(time.perf_counter() - self._start, 6),
+                    'timers': {k: {'calls': v[0], 'totalSeconds': round(v[1], 6),
+                                   'meanSeconds': round(v[1] / v[0], 6), 'maxSeconds': round(v[2], 6)}
+                               for k, v in self._timers.items()},
+                    'httpCalls': {k: {'calls': v[0], 'bytes': v[1]} for k, v in self._endpoints.items()},
+                    'httpCallsTotal': sum(v[0] for v in self._endpoints.values()),
+                    'bytesReceived': sum(v[1] for v in self._endpoints.values()),
+                    'cardinalities': {k: {'results': v[0], 'mean': round(v[1] / v[0], 2), 'max': v[2]}
+                                      for k, v in self._cardinalities.items()}}
+
+
+# stats of the running process
+STATS = RunStats()
@@ -1,14 +1,118 @@
 import datetime
-from typing import List, Dict, Optional, Union
+import random
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Optional, Union, Callable, Iterable, Any, Tuple, FrozenSet, TYPE_CHECKING
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from resources.cache import ResponseCache
+from resources.ratelimit import TokenBucket, AdaptiveLimiter
+from resources.stats import STATS
+
+if TYPE_CHECKING:
+    from resources.catalog import Catalog
 
 API_BASE_URL = 'http://www.thecocktaildb.com/api/json/v1/'  # API URL
 DEFAULT_API_KEY = '1'  # API key
+DEFAULT_POOL_SIZE = 10  # max kept-alive connections per host
+DEFAULT_MAX_WORKERS = 8  # max concurrent API calls
+DEFAULT_MEMO_SIZE = 10000  # max API call results remembered for coalescing
+DEFAULT_MAX_RETRIES = 5  # max retries of a throttled or failing call
+DEFAULT_TIMEOUT = 30  # seconds waited for a response
+BACKOFF_BASE = 0.5  # seconds waited before the first retry, doubled for each retry
+BACKOFF_MAX = 30  # max seconds waited before a retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # transient errors, call is retried
+AUTH_STATUSES = {401, 403, 404}  # key rejected (the key is part of the URL path), run is aborted
+SHORT_KEYS = ('idDrink', 'strDrink', 'strDrinkThumb')  # attributes kept in filter results
+PROBE_INGREDIENTS = ('Gin', 'Lemon')  # common ingredients used to detect the multi-ingredient filter
+DEFAULT_VERIFY_THRESHOLD = 8  # max filter candidates checked by detail lookup instead of more filter calls
+# estimated number of drinks returned by each filter key when not seen yet, smallest is queried first
+FILTER_CARDINALITY = {'i': 50, 'g': 150, 'c': 200, 'a': 500}
+# filter calls estimated within this factor of the most selective one not queried yet are queried together
+FILTER_BATCH_RATIO = 2
+# hint of each filter key
+FILTER_HINTS = {'i': 'ing', 'a': 'alc', 'c': 'cat', 'g': 'gla'}
+# list.php keys and the drink attribute each list holds
+LIST_KEYS = {'i': 'strIngredient1', 'a': 'strAlcoholic', 'c': 'strCategory', 'g': 'strGlass'}
 
 # typing reference
 DrinkQueried = Dict[str, Optional[str]]
 Hints = Dict[str, Union[str, List[str]]]
+ApiCall = Tuple[str, str, Union[str, List[str]]]
+
+INGREDIENT_SLOTS = 15  # number of ingredient/measure slots of a drink
+INGREDIENT_KEYS = tuple('strIngredient' + str(i) for i in range(1, INGREDIENT_SLOTS + 1))
+MEASURE_KEYS = tuple('strMeasure' + str(i) for i in range(1, INGREDIENT_SLOTS + 1))
+# drink attribute of each single value hint
+HINT_ATTRIBUTES = {'name': 'strDrink', 'alc': 'strAlcoholic', 'gla': 'strGlass', 'cat': 'strCategory'}
+
+
+def normalize(value: str) -> str:
+    """
+    Normalizes a drink value for case insensitive matching
+    :param value: str - drink value (name/ingredient/alcoholic/category/glass)
+    :return: str - casefolded value
+    """
+    return value.casefold()
+
+
+def drinkIngredients(drink: DrinkQueried) -> set:
+    """
+    Gets the normalized ingredients of a drink, slots after the first empty one are ignored
+    :param drink: Dict[str, Optional[str]] - full drink entry
+    :return: Set[str] - normalized ingredients
+    """
+    output = set()
+    for key in INGREDIENT_KEYS:
+        ingr = drink.get(key)
+        if not ingr:
+            break
+        output.add(normalize(ingr))
+    return output
+
+
+class HintPredicate:
+    """
+    Hints compiled once to check many drinks, values are normalized and ingredients kept as a set
+    """
+    __slots__ = ('_checks', '_ingredients')
+
+    def __init__(self, hints: Hints) -> None:
+        """
+        HintPredicate constructor
+        :param hints: Dict[str, Union[str, List[str]]] - hints to match (name/alc/gla/cat/ing), others are ignored
+        """
+        # values not strings (numbers) are compared as text
+        self._checks = tuple((HINT_ATTRIBUTES[k], normalize(str(v))) for k, v in hints.items() if k in HINT_ATTRIBUTES)
+        self._ingredients = frozenset(normalize(str(x)) for x in hints['ing']) if 'ing' in hints else frozenset()
+
+    def matches(self, drink: DrinkQueried) -> bool:
+        """
+        Checks if drink matches every hint
+        :param drink: Dict[str, Optional[str]] - full drink entry
+        :return: bool - True if all hints match
+        """
+        for attr, value in self._checks:
+            drinkValue = drink.get(attr)
+            if not drinkValue or normalize(drinkValue) != value:
+                return False
+        return not self._ingredients or self._ingredients <= drinkIngredients(drink)
+
+    def filter(self, drinks: Iterable[DrinkQueried]) -> List[DrinkQueried]:
+        """
+        Keeps drinks matching every hint
+        :param drinks: Iterable[Dict[str, Optional[str]]] - full drink entries
+        :return: List[Dict[str, Optional[str]]] - matching drink entries, in given order
+        """
+        if not self._checks and not self._ingredients:
+            return list(drinks)
+        matches = self.matches
+        return [drink for drink in drinks if matches(drink)]
 
 
 class Api:
@@ -16,17 +120,136 @@ class Api:
     Class for querying thecocktaildb API.
     """
 
-    def __init__(self, key: str = DEFAULT_API_KEY) -> None:
+    def __init__(self, key: str = DEFAULT_API_KEY, poolSize: int = DEFAULT_POOL_SIZE,
+                 maxWorkers: int = DEFAULT_MAX_WORKERS, cache: ResponseCache = None, catalog: 'Catalog' = None,
+                 baseUrl: str = API_BASE_URL, memoSize: int = DEFAULT_MEMO_SIZE,
+                 verifyThreshold: int = DEFAULT_VERIFY_THRESHOLD, rateLimit: float = None,
+                 maxRetries: int = DEFAULT_MAX_RETRIES, fastReject: bool = False) -> None:
         """
         API constructor
+        Opens a pooled keep-alive session reused by every query of this object, call close() when done
         :param key: str - API key, default 1 (test API key)
+        :param poolSize: int - max number of connections kept alive in the session pool
+        :param maxWorkers: int - max number of API calls running concurrently, 1 to run them one at a time
+        :param cache: ResponseCache - optional response cache checked before calling the API
+        :param catalog: Catalog - optional local catalog answering every query instead of the API (offline mode)
+        :param baseUrl: str - API URL, default TheCocktailDB
+        :param memoSize: int - max number of call results remembered, identical calls made while a call is in flight or
+                               remembered share its result instead of being repeated, 0 to disable
+        :param verifyThreshold: int - once filter results have this many drinks in common or less, remaining filters
+                                      are checked on their detail lookups instead of being queried
+        :param rateLimit: float - max API calls per second, None for no limit
+        :param maxRetries: int - max retries of a throttled (429) or failing (5xx, connection error) call, with
+                                 jittered exponential backoff, concurrent calls are reduced while throttled
+        :param fastReject: bool - reject without calling the API filters naming a value missing from the list.php
+                                  values (ingredients, glasses, categories, alcoholic) and ids not numeric
         """
         self._keyApi = key
+        self._cache = cache
+        self._catalog = catalog
+        self._baseUrl = baseUrl
+        # cached responses are kept apart by server and key
+        self._source = baseUrl + key
+        self._maxWorkers = max(1, maxWorkers)
+        self._executor = None
+        self._memoSize = memoSize
+        self._memo = OrderedDict()
+        self._memoLock = threading.Lock()
+        self.callsRequested = 0
+        self.callsSaved = 0
+        # remembered calls made ahead by prefetch and not requested yet, their first request is not a saved call
+        self._prefetched = set()
+        self._verifyThreshold = verifyThreshold
+        self._maxRetries = maxRetries
+        self._bucket = TokenBucket(rateLimit, max(1, int(rateLimit))) if rateLimit else None
+        self._limiter = AdaptiveLimiter(self._maxWorkers)
+        # retries of throttled or failing calls, counted by every calling thread
+        self.retries = 0
+        self._retriesLock = threading.Lock()
+        # multi-ingredient filter support of the key, None until detected
+        self._multiFilter = None
+        self._probeLock = threading.Lock()
+        # normalized list.php values by filter key, None until loaded
+        self._fastReject = fastReject
+        self._known = None
+        self._knownLock = threading.Lock()
+        # number of drinks returned by each filter call seen
+        self._cardinality = {}
+        self._session = requests.Session()
+        # keep enough connections alive for every worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(poolSize, self._maxWorkers))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def __enter__(self) -> 'Api':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the worker threads, the session and its pooled connections
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._session.close()
+
+    def clearMemo(self) -> None:
+        """
+        Forgets remembered call results, next calls query the API again
+        :return: None
+        """
+        with self._memoLock:
+            self._memo.clear()
+            self._prefetched.clear()
+
+    def _map(self, func: Callable[..., Any], calls: Iterable[tuple]) -> List[Any]:
+        """
+        Calls func with each args tuple concurrently (bounded by maxWorkers)
+        Results keep the order of the given calls, first exception raised is propagated
+        :param func: Callable - function to call
+        :param calls: Iterable[tuple] - args given to func for each call
+        :return: List - func results in calls order
+        """
+        calls = list(calls)
+        if self._maxWorkers == 1 or len(calls) < 2:
+            return [func(*args) for args in calls]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._maxWorkers)
+        return list(self._executor.map(lambda args: func(*args), calls))
 
-    def query(self, hints: Hints = None) -> List[DrinkQueried]:
+    def queryMany(self, calls: Iterable[ApiCall], ignoreEmpty: bool = False,
+                  prefetch: bool = False) -> List[List[DrinkQueried]]:
+        """
+        Queries the API concurrently for each (searchType, key, payload) call
+        :param calls: Iterable[Tuple[str, str, Union[str, List[str]]]] - queryApi args of each call
+        :param ignoreEmpty: bool - give an empty list for calls with no results instead of raising TypeError
+        :param prefetch: bool - calls made ahead of the searches needing them, not counted as requested (see queryApi)
+        :return: List[List[Dict[str, Optional[str]]]] - list of drink entries of each call, in calls order
+        """
+        if not ignoreEmpty and not prefetch:
+            return self._map(self.queryApi, calls)
+
+        def queryOrEmpty(searchType: str, key: str, payload: Union[str, List[str]]) -> List[DrinkQueried]:
+            try:
+                return self.queryApi(searchType, key, payload, prefetch)
+            except TypeError:
+                if not ignoreEmpty:
+                    raise
+                return []
+        return self._map(queryOrEmpty, calls)
+
+    @STATS.timed('Api.query')
+    def query(self, hints: Hints = None, fields: Iterable[str] = None, limit: int = None) -> List[DrinkQueried]:
         """
         Query manager, calls desired query from argument given
         :param hints: Dict[str, Union[str, List[str]]] - cocktail hints
+        :param fields: Iterable[str] - drink attributes needed, default all. Filter results are returned without detail
+                       lookups when they hold every needed attribute (SHORT_KEYS) and no hint is left to check
+        :param limit: int - max number of drinks returned, default all. Only these drinks get detail lookups
         :return: List[Dict[str, Optional[str]]] - List of drink dictionary
         """
         id_ = hints['id'] if 'id' in hints else None
@@ -46,28 +269,41 @@ class Api:
 
         # make ID the main query to cross reference
         if id_:
+            if self._fastReject and not str(id_).isdigit():
+                raise TypeError('Query results 0 - Information does not exist in database.')
             mainQuery = self.queryApi('lookup', 'i', id_)
             del hints['id']
-            output = self.filterDrink(mainQuery, hints)
+            output = self.filterDrink(mainQuery, hints)[:limit]
         # make name the main query to cross reference
         elif name:
             mainQuery = self.queryApi('search', 's', name)
             del hints['name']
-            output = self.filterDrink(mainQuery, hints)
+            output = self.filterDrink(mainQuery, hints)[:limit]
         # query filters then find common entries: ingredients/alcohol/category/glass
         else:
-            qResults = self.queryFilters(ingredients=ing, alcoholic=alc, category=cat, glass=gla)
-            commonKeys = self.intersectKeys(*qResults)
-            # get cocktail detail for each entry
-            output = [self.queryApi('lookup', 'i', x) for x in commonKeys]
-            output = [x[0] for x in output]
+            calls = self.filterCalls(ingredients=ing, alcoholic=alc, category=cat, glass=gla)
+            self.rejectUnknown(calls)
+            common, verifyHints = self.planFilters(calls)
+            STATS.addCardinality('Api.planFilters', len(common))
+            # filter results hold every needed attribute, no detail lookup
+            if not verifyHints and fields is not None and set(fields) <= set(SHORT_KEYS):
+                output = common[:limit]
+            else:
+                # get cocktail detail for each entry, all of them if some must still be checked
+                hydrate = common if verifyHints else common[:limit]
+                output = self.queryMany([('lookup', 'i', x['idDrink']) for x in hydrate])
+                output = [x[0] for x in output]
+            # check filters not queried
+            if verifyHints:
+                output = self.filterDrink(output, verifyHints)[:limit]
         # no ID or no hint, raise error and skip this drink query input
         if not output:
             raise TypeError("Query results 0 - No entry found with given requirements")
-
+        STATS.addCardinality('Api.query', len(output))
         return output
 
     @staticmethod
+    @STATS.timed('Api.filterDrink')
     def filterDrink(mainDrinks: List[DrinkQueried], filterChecks: Hints) -> List[DrinkQueried]:
         """
         Finds drinks from mainDrinks with common details as given filterCheck
@@ -75,209 +311,437 @@ class Api:
         :param filterChecks: Dict[str, Optional[str, List[str]]] - Dict of hints to find in common
         :return:
         """
-        output = []
-        # iterate through drinks (when querying name, multiple drinks are given possibly)
-        for drink in mainDrinks:
-            toSkip = False
-            # go through filter hints
-            # if hint not found but available, mark to skip drink entry for output
-            for checkKey, checkVal in filterChecks.items():
-                # check name match
-                if checkKey == 'name':
-                    if drink['strDrink'].upper() != checkVal.upper():
-                        toSkip = True
-                        break
-                # check alcohol match
-                if checkKey == 'alc':
-                    if drink['strAlcoholic'].upper() != checkVal.upper():
-                        toSkip = True
-                        break
-                # check glass match
-                if checkKey == 'gla':
-                    if drink['strGlass'].upper() != checkVal.upper():
-                        toSkip = True
-                        break
-                # check category match
-                if checkKey == 'cat':
-                    if drink['strCategory'].upper() != checkVal.upper():
-                        toSkip = True
-                        break
-                # check ingredient match
-                if checkKey == 'ing':
-                    # checkVal is a list of str ingredients
-                    # iterate through ingredients
-                    for ingredientEntry in checkVal:
-                        ingList = []
-                        # check ingredient list of drink [1-15]
-                        for i in range(1, 15 + 1):
-                            if not drink["strIngredient" + str(i)]:
-                                break
-                            ingList.append(drink["strIngredient" + str(i)].upper())
-                        # check if an ingredient is missing
-                        if ingredientEntry.upper() not in ingList:
-                            toSkip = True
-                            break
-                    if toSkip:
-                        break
-            # if all match, add to output
-            if not toSkip:
-                output.append(drink)
+        output = HintPredicate(filterChecks).filter(mainDrinks)
+        STATS.addCardinality('Api.filterDrink', len(output))
         return output
 
+    @STATS.timed('Api.queryApi')
+    def queryApi(self, searchType: str, key: str, payload: Union[str, List[str]],
+                 prefetch: bool = False) -> List[DrinkQueried]:
+        """
+        Queries the API with given args
+        Identical calls are coalesced: a call in flight or remembered is awaited instead of repeated
+        :param searchType: str - lookup/filter
+        :param key: str - s/i/a/c/g
+        :param payload: str - param payload (public test key call)
+                        list - param payload (premium key & ingredients call)
+        :param prefetch: bool - call made ahead of the searches needing it, not counted as requested, the first search
+                               requesting it is not counted as saved either
+        :return: List[Dict[str, Optional[str]]] - list of drink entry
+        """
+        if not self._memoSize:
+            if not prefetch:
+                self.callsRequested += 1
+            return self._fetch(searchType, key, payload)
+        callKey = self._callKey(searchType, key, payload)
+        with self._memoLock:
+            if not prefetch:
+                self.callsRequested += 1
+            future = self._memo.get(callKey)
+            if future is not None:
+                # only requests sharing a result another request needed are saved calls
+                if callKey in self._prefetched:
+                    if not prefetch:
+                        self._prefetched.discard(callKey)
+                elif not prefetch:
+                    self.callsSaved += 1
+                self._memo.move_to_end(callKey)
+                isOwner = False
+            else:
+                future = self._memo[callKey] = Future()
+                isOwner = True
+                if prefetch:
+                    self._prefetched.add(callKey)
+                # forget least recently used results
+                if len(self._memo) > self._memoSize:
+                    self._prefetched.discard(self._memo.popitem(last=False)[0])
+        if not isOwner:
+            return future.result()
+        # errors are shared too, same drinks get the same result
+        try:
+            future.set_result(self._fetch(searchType, key, payload))
+        except BaseException as e:
+            future.set_exception(e)
+            # transient failure, next identical call tries again
+            if isinstance(e, requests.exceptions.RetryError):
+                with self._memoLock:
+                    if self._memo.get(callKey) is future:
+                        del self._memo[callKey]
+                        self._prefetched.discard(callKey)
+        return future.result()
+
+    def _get(self, url: str, params: Dict[str, Union[str, List[str]]]) -> requests.Response:
+        """
+        Sends a GET request, retrying throttled and failing calls with jittered exponential backoff
+        :param url: str - endpoint URL
+        :param params: Dict[str, Union[str, List[str]]] - query params
+        :return: requests.Response - response with status 200
+        """
+        for attempt in range(self._maxRetries + 1):
+            if self._bucket is not None:
+                self._bucket.acquire()
+            error = None
+            with self._limiter:
+                try:
+                    data = self._session.get(url, params=params, timeout=DEFAULT_TIMEOUT)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    data, error = None, e
+            if data is not None and data.status_code == 200:
+                self._limiter.onSuccess()
+                return data
+            # Response code not 200
+            if data is not None and data.status_code in AUTH_STATUSES:
+                raise requests.exceptions.HTTPError("Bad API key", response=data)
+            if data is not None and data.status_code not in RETRY_STATUSES:
+                raise TypeError('Query results 0 - Cannot retrieve information.')
+            if data is not None and data.status_code == 429:
+                self._limiter.onThrottle()
+            if attempt == self._maxRetries:
+                break
+            with self._retriesLock:
+                self.retries += 1
+            time.sleep(self._backoff(attempt, data))
+        reason = error if data is None else 'status ' + str(data.status_code)
+        raise requests.exceptions.RetryError('Query failed after ' + str(self._maxRetries) + ' retries: ' + str(reason))
+
     @staticmethod
-    def intersectKeys(*cocktails: List[DrinkQueried]) -> List[str]:
+    def _backoff(attempt: int, data: Optional[requests.Response]) -> float:
         """
-        From given cocktail dicts, finds common idDrink strings
-        :param cocktails: List[Dict[str, Optional[str]]] - Lists of cocktail dicts
-        :return: List[str] - List of idDrink strings
+        Gets seconds to wait before a retry, Retry-After header if given else full jitter exponential backoff
+        :param attempt: int - number of the failed attempt, from 0
+        :param data: requests.Response - failed response, None if no response
+        :return: float - seconds to wait
         """
-        keysList = []
-        for drink in cocktails:
-            keys = set(x['idDrink'] for x in drink)
-            keysList.append(keys)
-        return list(set.intersection(*keysList))
+        retryAfter = data.headers.get('Retry-After', '') if data is not None else ''
+        if retryAfter.isdigit():
+            return min(BACKOFF_MAX, int(retryAfter))
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
 
-    def queryApi(self, searchType: str, key: str, payload: Union[str, List[str]]) -> List[DrinkQueried]:
+    def _fetch(self, searchType: str, key: str, payload: Union[str, List[str]]) -> List[DrinkQueried]:
         """
         Queries the API with given args
         :param searchType: str - lookup/filter
         :param key: str - s/i/a/c/g
-        :param payload: str - param payload (public test key call)
-                        list - param payload (premium key & ingredients call)
+        :param payload: str - param payload, comma separated ingredients for a multi-ingredient filter
         :return: List[Dict[str, Optional[str]]] - list of drink entry
         """
-        try:
-            url = API_BASE_URL + self._keyApi + '/' + searchType + '.php'
-            data = requests.get(url, params={key: payload})
-            data.raise_for_status()
-        # Response code not 200
-        except requests.exceptions.HTTPError as e:
-            raise requests.exceptions.HTTPError("Bad API key") from e
+        # offline mode, no HTTP
+        if self._catalog is not None:
+            return self._catalog.queryApi(searchType, key, payload)
+        if self._cache is not None:
+            cached = self._cache.get(searchType, key, payload, self._source)
+            if cached is not None:
+                return cached
+            # same call gave no results before
+            message = self._cache.getNegative(searchType, key, payload, self._source)
+            if message is not None:
+                raise TypeError(message)
+        url = self._baseUrl + self._keyApi + '/' + searchType + '.php'
+        data = self._get(url, {key: payload})
+        STATS.addCall(searchType, len(data.content))
         # Response empty/not found, may be triggered when using public API key
         if data.text == '':
-            raise TypeError('Query results 0 - Cannot retrieve information.')
+            self._noResults(searchType, key, payload, 'Query results 0 - Cannot retrieve information.')
         data = data.json()
-        # check if theres contents in drinks
-        try:
-            data['drinks']
-            data['drinks'][0]
-        # Response gave None
-        except TypeError:
-            raise TypeError('Query results 0 - Information does not exist in database.')
-        return data['drinks']
+        drinks = data.get('drinks') if isinstance(data, dict) else None
+        # Response gave None, or a message ("None Found") instead of a list of drinks
+        if not isinstance(drinks, list) or not drinks or not isinstance(drinks[0], dict):
+            self._noResults(searchType, key, payload, 'Query results 0 - Information does not exist in database.')
+        if self._cache is not None:
+            self._cache.set(searchType, key, payload, drinks, self._source)
+        STATS.addCardinality('Api.queryApi ' + searchType, len(drinks))
+        return drinks
+
+    def _noResults(self, searchType: str, key: str, payload: Union[str, List[str]], message: str) -> None:
+        """
+        Stores a call with no results in the negative cache and raises its error
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :param message: str - error message
+        :return: None
+        """
+        if self._cache is not None:
+            self._cache.setNegative(searchType, key, payload, message, self._source)
+        raise TypeError(message)
+
+    def knownValues(self) -> Dict[str, FrozenSet[str]]:
+        """
+        Gets the normalized list.php values of each filter key, loaded once (cached like other responses)
+        Lists that cannot be loaded are left out, their filters are not rejected
+        :return: Dict[str, FrozenSet[str]] - values by filter key (i/a/c/g)
+        """
+        if self._known is not None:
+            return self._known
+        with self._knownLock:
+            if self._known is None:
+                keys = list(LIST_KEYS)
+                try:
+                    lists = self.queryMany([('list', k, 'list') for k in keys], ignoreEmpty=True)
+                # API unavailable, load again on next call
+                except requests.exceptions.RetryError:
+                    return {}
+                self._known = {k: frozenset(normalize(x[LIST_KEYS[k]]) for x in result if x.get(LIST_KEYS[k]))
+                               for k, result in zip(keys, lists) if result}
+        return self._known
+
+    def rejectUnknown(self, calls: List[ApiCall]) -> None:
+        """
+        Fast reject, raises the API error of filter calls naming a value missing from list.php without calling the API
+        Does nothing unless enabled
+        :param calls: List[Tuple[str, str, Union[str, List[str]]]] - filter calls
+        :return: None
+        """
+        if not self._fastReject:
+            return
+        known = self.knownValues()
+        for _, key, payload in calls:
+            values = known.get(key)
+            if values is None:
+                continue
+            for value in (payload.split(',') if key == 'i' else [payload]):
+                if normalize(str(value).strip()) not in values:
+                    raise TypeError('Query results 0 - Cannot retrieve information.')
 
-    def queryFilters(self, ingredients: List[str] = None, alcoholic: str = None, category: str = None,
-                     glass: str = None) -> List[List[DrinkQueried]]:
+    def filterCalls(self, ingredients: List[str] = None, alcoholic: str = None, category: str = None,
+                    glass: str = None) -> List[ApiCall]:
         """
-        Fetch list of cocktails with cocktail filters from API
+        Gets the API calls needed to fetch cocktails with cocktail filters
+        :param ingredients: List[str] - List of ingredient strings
         :param alcoholic: str - Alcoholic, Non Alcoholic, or Optional alcohol
         :param category: str - drink category: Ordinary Drink, Cocktail, Cocoa, etc
         :param glass: str - glass type: Highball glass, Cocktail glass, etc
-        :param ingredients: List[str] - List of filters (ingredients/alcoholic/category/glass) strings
-        :return: List[List[Dict[str, Optional[str]]]] - List containing the List of drinks Dict queried from the filter hints
+        :return: List[Tuple[str, str, Union[str, List[str]]]] - queryApi args of each call
         """
-        # holds all drink query responses
-        cocktails = []
+        # holds all filter calls to make (searchType, key, payload)
+        calls = []
         # get drinks from ingredients
         if ingredients:
-            # if premium key, use multi-ingredient filter
-            if self._keyApi == DEFAULT_API_KEY:
-                f1 = self.queryApi('filter', 'i', ingredients)
-                if f1:
-                    cocktails.append(f1)
+            # same ingredient may be given twice, values not strings (numbers) are sent as text like any query param
+            ingredients = list({normalize(x): x for x in map(str, ingredients)}.values())
+            # if supported (premium key), one multi-ingredient filter call
+            if len(ingredients) > 1 and self.supportsMultiFilter():
+                calls.append(('filter', 'i', ','.join(ingredients)))
             # iterate through ingredients
             else:
                 for ingr in ingredients:
-                    f1 = self.queryApi('filter', 'i', ingr)
-                    if f1:
-                        cocktails.append(f1)
+                    calls.append(('filter', 'i', ingr))
         # get drinks from alcohol
         if alcoholic:
-            f2 = self.queryApi('filter', 'a', alcoholic)
-            if f2:
-                cocktails.append(f2)
+            calls.append(('filter', 'a', alcoholic))
         # get drinks from category
         if category:
-            f3 = self.queryApi('filter', 'c', category)
-            if f3:
-                cocktails.append(f3)
+            calls.append(('filter', 'c', category))
         # get drinks from class
         if glass:
-            f4 = self.queryApi('filter', 'g', glass)
-            if f4:
-                cocktails.append(f4)
+            calls.append(('filter', 'g', glass))
+        return calls
 
-        return cocktails
+    def supportsMultiFilter(self) -> bool:
+        """
+        Detects if the key supports the multi-ingredient filter (filter.php?i=a,b), premium keys only
+        Probed once with two common ingredients, result kept in the response cache if any
+        :return: bool - True if supported
+        """
+        if self._multiFilter is not None:
+            return self._multiFilter
+        # local catalog answers every filter
+        if self._catalog is not None:
+            self._multiFilter = True
+            return True
+        with self._probeLock:
+            if self._multiFilter is not None:
+                return self._multiFilter
+            metaKey = 'multiFilter ' + self._source
+            stored = self._cache.getMeta(metaKey) if self._cache is not None else None
+            if stored is not None:
+                self._multiFilter = stored == '1'
+                return self._multiFilter
+            try:
+                data = self._get(self._baseUrl + self._keyApi + '/filter.php', {'i': ','.join(PROBE_INGREDIENTS)})
+                STATS.addCall('filter', len(data.content))
+                data = data.json() if data.text else None
+                drinks = data.get('drinks') if isinstance(data, dict) else None
+            # not a JSON response, not supported
+            except ValueError:
+                drinks = None
+            # status refusing the call, not supported
+            except TypeError:
+                drinks = None
+            # API unavailable, detect again on next call
+            except requests.exceptions.RetryError:
+                return False
+            self._multiFilter = isinstance(drinks, list) and bool(drinks) and isinstance(drinks[0], dict)
+            if self._cache is not None:
+                self._cache.setMeta(metaKey, '1' if self._multiFilter else '0')
+            return self._multiFilter
+
+    def planCalls(self, hints: Hints) -> List[ApiCall]:
+        """
+        Gets the first API calls query() makes with given hints, detail lookups of filter results are not known yet
+        :param hints: Dict[str, Union[str, List[str]]] - cocktail hints
+        :return: List[Tuple[str, str, Union[str, List[str]]]] - queryApi args of each call, empty if hints not valid
+        """
+        # same checks as query(), invalid hints make no call
+        if not hints or not all(hints.values()) or ('ing' in hints and not all(hints['ing'])):
+            return []
+        if 'id' in hints:
+            if self._fastReject and not str(hints['id']).isdigit():
+                return []
+            return [('lookup', 'i', hints['id'])]
+        if 'name' in hints:
+            return [('search', 's', hints['name'])]
+        calls = self.filterCalls(hints.get('ing'), hints.get('alc'), hints.get('cat'), hints.get('gla'))
+        try:
+            self.rejectUnknown(calls)
+        except TypeError:
+            return []
+        # later filter calls depend on the first results
+        return self.orderFilterCalls(calls)[:1]
+
+    @staticmethod
+    def _callKey(searchType: str, key: str, payload: Union[str, List[str]]) -> tuple:
+        """
+        Gets hashable key of an API call
+        :param searchType: str - lookup/search/filter/list
+        :param key: str - s/i/a/c/g/f
+        :param payload: Union[str, List[str]] - param payload
+        :return: tuple - call key
+        """
+        return searchType, key, tuple(payload) if isinstance(payload, list) else payload
+
+    def orderFilterCalls(self, calls: List[ApiCall]) -> List[ApiCall]:
+        """
+        Orders filter calls by estimated selectivity, most selective first
+        Uses the number of drinks of previous responses, else a default by filter key
+        :param calls: List[Tuple[str, str, Union[str, List[str]]]] - filter calls
+        :return: List[Tuple[str, str, Union[str, List[str]]]] - ordered filter calls
+        """
+        # stable sort keeps given order on ties
+        return sorted(calls, key=self._estimate)
+
+    def _estimate(self, call: ApiCall) -> int:
+        """
+        Estimates the number of drinks returned by a filter call
+        :param call: Tuple[str, str, Union[str, List[str]]] - filter call
+        :return: int - drinks of the previous response, else the default of the filter key
+        """
+        return self._cardinality.get(self._callKey(*call), FILTER_CARDINALITY.get(call[1], 0))
+
+    def _filterBatch(self, ordered: List[ApiCall], start: int) -> List[ApiCall]:
+        """
+        Gets the next filter calls to query concurrently: the two most selective ones first, then each call with the
+        calls estimated within FILTER_BATCH_RATIO of it (a close estimate is unlikely to stop the plan before them)
+        :param ordered: List[Tuple[str, str, Union[str, List[str]]]] - filter calls, most selective first
+        :param start: int - index of the first call not queried yet
+        :return: List[Tuple[str, str, Union[str, List[str]]]] - calls of the batch, in order
+        """
+        end = start + (2 if start == 0 else 1)
+        limit = FILTER_BATCH_RATIO * self._estimate(ordered[start])
+        while end < len(ordered) and self._estimate(ordered[end]) <= limit:
+            end += 1
+        return ordered[start:end]
+
+    @STATS.timed('Api.planFilters')
+    def planFilters(self, calls: List[ApiCall]) -> Tuple[List[DrinkQueried], Hints]:
+        """
+        Queries filter calls by selectivity, by concurrent batches of close estimates, and intersects their results
+        Stops when no drink is in common, or when few enough are left to be checked on their detail lookups
+        :param calls: List[Tuple[str, str, Union[str, List[str]]]] - filter calls
+        :return: Tuple[List[Dict[str, Optional[str]]], Dict[str, Union[str, List[str]]]] - filter results in common
+                                                                                        (SHORT_KEYS attributes),
+                                                                                        hints of the filters not queried
+        """
+        ordered = self.orderFilterCalls(calls)
+        common = None
+        done = 0
+        while done < len(ordered):
+            batch = self._filterBatch(ordered, done)
+            for call, drinks in zip(batch, self.queryMany(batch)):
+                self._cardinality[self._callKey(*call)] = len(drinks)
+                if common is None:
+                    common = drinks
+                else:
+                    keys = set(x['idDrink'] for x in drinks)
+                    common = [x for x in common if x['idDrink'] in keys]
+            done += len(batch)
+            if not common:
+                return [], {}
+            # verify remaining filters by detail lookup
+            if len(common) <= self._verifyThreshold and done < len(ordered):
+                return common, self._callsHints(ordered[done:])
+        return common or [], {}
+
+    @staticmethod
+    def _callsHints(calls: List[ApiCall]) -> Hints:
+        """
+        Converts filter calls back to hints
+        :param calls: List[Tuple[str, str, Union[str, List[str]]]] - filter calls
+        :return: Dict[str, Union[str, List[str]]] - hints (ing/alc/cat/gla)
+        """
+        hints = {}
+        for _, key, payload in calls:
+            if key == 'i':
+                hints.setdefault('ing', []).extend(payload if isinstance(payload, list) else payload.split(','))
+            else:
+                hints[FILTER_HINTS[key]] = payload
+        return hints
+
+
+# attribute and API key of each single value cocktail field
+COCKTAIL_FIELDS = (('id', 'idDrink'),
+                   ('nameEN', 'strDrink'),
+                   ('nameAlt', 'strDrinkAlternate'),
+                   ('nameES', 'strDrinkES'),
+                   ('nameDE', 'strDrinkDE'),
+                   ('nameFR', 'strDrinkFR'),
+                   ('nameZHHANS', 'strDrinkZH-HANS'),
+                   ('nameZHHANT', 'strDrinkZH-HANT'),
+                   ('tags', 'strTags'),
+                   ('video', 'strVideo'),
+                   ('category', 'strCategory'),
+                   ('iba', 'strIBA'),
+                   ('alcoholic', 'strAlcoholic'),
+                   ('glass', 'strGlass'),
+                   ('instructionsEN', 'strInstructions'),
+                   ('instructionsES', 'strInstructionsES'),
+                   ('instructionsDE', 'strInstructionsDE'),
+                   ('instructionsFR', 'strInstructionsFR'),
+                   ('instructionsZHHANS', 'strInstructionsZH-HANS'),
+                   ('instructionsZHHANT', 'strInstructionsZH-HANT'),
+                   ('thumb', 'strDrinkThumb'),
+                   ('imgSrc', 'strImageSource'),
+                   ('imgAttr', 'strImageAttribution'),
+                   ('creativeCC', 'strCreativeCommonsConfirmed'),
+                   ('dateMod', 'dateModified'))
+# output language code and attribute suffix of translated fields
+LANGUAGES = (('en', 'EN'), ('es', 'ES'), ('de', 'DE'), ('fr', 'FR'), ('ZH-HANS', 'ZHHANS'), ('ZH-HANT', 'ZHHANT'))
+# language code and attribute of each translated field
+LANGUAGE_ATTRIBUTES = {attribute: tuple((code, attribute + suffix) for code, suffix in LANGUAGES)
+                       for attribute in ('name', 'instructions')}
 
 
 class Cocktail:
     """
     Cocktail class for accessing cocktail information attributes
     """
+    __slots__ = tuple(attr for attr, _ in COCKTAIL_FIELDS) + ('ingredients', 'measures')
 
     def __init__(self, cocktailDict: Dict[str, str]) -> None:
         """
         Cocktail constructor
         If not in dict, set to None
-        :param cocktailDict: Dict[str, str] - attribute inputs
-        """
-        self.id = cocktailDict["idDrink"] if "idDrink" in cocktailDict else None
-        self.nameEN = cocktailDict["strDrink"] if "strDrink" in cocktailDict else None
-        self.nameAlt = cocktailDict["strDrinkAlternate"] if "strDrinkAlternate" in cocktailDict else None
-        self.nameES = cocktailDict["strDrinkES"] if "strDrinkES" in cocktailDict else None
-        self.nameDE = cocktailDict["strDrinkDE"] if "strDrinkDE" in cocktailDict else None
-        self.nameFR = cocktailDict["strDrinkFR"] if "strDrinkFR" in cocktailDict else None
-        self.nameZHHANS = cocktailDict["strDrinkZH-HANS"] if "strDrinkZH-HANS" in cocktailDict else None
-        self.nameZHHANT = cocktailDict["strDrinkZH-HANT"] if "strDrinkZH-HANT" in cocktailDict else None
-        self.tags = cocktailDict["strTags"] if "strTags" in cocktailDict else None
-        self.video = cocktailDict["strVideo"] if "strVideo" in cocktailDict else None
-        self.category = cocktailDict["strCategory"] if "strCategory" in cocktailDict else None
-        self.iba = cocktailDict["strIBA"] if "strIBA" in cocktailDict else None
-        self.alcoholic = cocktailDict["strAlcoholic"] if "strAlcoholic" in cocktailDict else None
-        self.glass = cocktailDict["strGlass"] if "strGlass" in cocktailDict else None
-        self.instructionsEN = cocktailDict["strInstructions"] if "strInstructions" in cocktailDict else None
-        self.instructionsES = cocktailDict["strInstructionsES"] if "strInstructionsES" in cocktailDict else None
-        self.instructionsDE = cocktailDict["strInstructionsDE"] if "strInstructionsDE" in cocktailDict else None
-        self.instructionsFR = cocktailDict["strInstructionsFR"] if "strInstructionsFR" in cocktailDict else None
-        self.instructionsZHHANS = cocktailDict["strInstructionsZH-HANS"] if "strInstructionsZH-HANS" in cocktailDict else None
-        self.instructionsZHHANT = cocktailDict["strInstructionsZH-HANT"] if "strInstructionsZH-HANT" in cocktailDict else None
-        self.thumb = cocktailDict["strDrinkThumb"] if "strDrinkThumb" in cocktailDict else None
-        self.imgSrc = cocktailDict["strImageSource"] if "strImageSource" in cocktailDict else None
-        self.imgAttr = cocktailDict["strImageAttribution"] if "strImageAttribution" in cocktailDict else None
-        self.creativeCC = cocktailDict["strCreativeCommonsConfirmed"] if "strCreativeCommonsConfirmed" in cocktailDict else None
-        self.dateMod = cocktailDict["dateModified"] if "dateModified" in cocktailDict else None
-
-        self.ingredient1 = cocktailDict["strIngredient1"] if "strIngredient1" in cocktailDict else None
-        self.ingredient2 = cocktailDict["strIngredient2"] if "strIngredient2" in cocktailDict else None
-        self.ingredient3 = cocktailDict["strIngredient3"] if "strIngredient3" in cocktailDict else None
-        self.ingredient4 = cocktailDict["strIngredient4"] if "strIngredient4" in cocktailDict else None
-        self.ingredient5 = cocktailDict["strIngredient5"] if "strIngredient5" in cocktailDict else None
-        self.ingredient6 = cocktailDict["strIngredient6"] if "strIngredient6" in cocktailDict else None
-        self.ingredient7 = cocktailDict["strIngredient7"] if "strIngredient7" in cocktailDict else None
-        self.ingredient8 = cocktailDict["strIngredient8"] if "strIngredient8" in cocktailDict else None
-        self.ingredient9 = cocktailDict["strIngredient9"] if "strIngredient9" in cocktailDict else None
-        self.ingredient10 = cocktailDict["strIngredient10"] if "strIngredient10" in cocktailDict else None
-        self.ingredient11 = cocktailDict["strIngredient11"] if "strIngredient11" in cocktailDict else None
-        self.ingredient12 = cocktailDict["strIngredient12"] if "strIngredient12" in cocktailDict else None
-        self.ingredient13 = cocktailDict["strIngredient13"] if "strIngredient13" in cocktailDict else None
-        self.ingredient14 = cocktailDict["strIngredient14"] if "strIngredient14" in cocktailDict else None
-        self.ingredient15 = cocktailDict["strIngredient15"] if "strIngredient15" in cocktailDict else None
-
-        self.measure1 = cocktailDict["strMeasure1"] if "strMeasure1" in cocktailDict else None
-        self.measure2 = cocktailDict["strMeasure2"] if "strMeasure2" in cocktailDict else None
-        self.measure3 = cocktailDict["strMeasure3"] if "strMeasure3" in cocktailDict else None
-        self.measure4 = cocktailDict["strMeasure4"] if "strMeasure4" in cocktailDict else None
-        self.measure5 = cocktailDict["strMeasure5"] if "strMeasure5" in cocktailDict else None
-        self.measure6 = cocktailDict["strMeasure6"] if "strMeasure6" in cocktailDict else None
-        self.measure7 = cocktailDict["strMeasure7"] if "strMeasure7" in cocktailDict else None
-        self.measure8 = cocktailDict["strMeasure8"] if "strMeasure8" in cocktailDict else None
-        self.measure9 = cocktailDict["strMeasure9"] if "strMeasure9" in cocktailDict else None
-        self.measure10 = cocktailDict["strMeasure10"] if "strMeasure10" in cocktailDict else None
-        self.measure11 = cocktailDict["strMeasure11"] if "strMeasure11" in cocktailDict else None
-        self.measure12 = cocktailDict["strMeasure12"] if "strMeasure12" in cocktailDict else None
-        self.measure13 = cocktailDict["strMeasure13"] if "strMeasure13" in cocktailDict else None
-        self.measure14 = cocktailDict["strMeasure14"] if "strMeasure14" in cocktailDict else None
-        self.measure15 = cocktailDict["strMeasure15"] if "strMeasure15" in cocktailDict else None
+        :param cocktailDict: Dict[str, str] - attribute inputs, TypeError raised if not a dict
+        """
+        # input entry that is not a drink, skipped like an entry with no hints
+        if not isinstance(cocktailDict, Mapping):
+            raise TypeError("Query results 0 - No hints given")
+        get = cocktailDict.get
+        for attr, key in COCKTAIL_FIELDS:
+            setattr(self, attr, get(key))
+        # ingredient/measure of slots [1-15]
+        self.ingredients = tuple(map(get, INGREDIENT_KEYS))
+        self.measures = tuple(map(get, MEASURE_KEYS))
 
     def getHint(self) -> Dict[str, str]:
         """
@@ -293,11 +757,7 @@ class Cocktail:
             output['id'] = self.id
         if self.nameEN is not None:
             output['name'] = self.nameEN
-        ingrList = []
-        for i in range(1, 15 + 1):
-            ingr = getattr(self, 'ingredient' + str(i))
-            if ingr is not None:
-                ingrList.append(ingr)
+        ingrList = [ingr for ingr in self.ingredients if ingr is not None]
         if ingrList:
             output['ing'] = ingrList
         if self.alcoholic is not None:
@@ -316,15 +776,15 @@ class Cocktail:
                                           "measure": "1 oz "}, {...}]
         """
         output = []
-        for i in range(1, 15 + 1):
-            recipe = {}
-            if getattr(self, 'ingredient' + str(i)) is not None:
-                recipe['ingredient'] = getattr(self, 'ingredient' + str(i))
-            if getattr(self, 'measure' + str(i)) is not None:
-                recipe['measure'] = getattr(self, 'measure' + str(i))
+        for ingr, measure in zip(self.ingredients, self.measures):
             # if no ingredient/measurement, skip
-            if not recipe:
+            if ingr is None and measure is None:
                 continue
+            recipe = {}
+            if ingr is not None:
+                recipe['ingredient'] = ingr
+            if measure is not None:
+                recipe['measure'] = measure
             output.append(recipe)
         return output
 
@@ -336,17 +796,11 @@ class Cocktail:
                                     ex: {"en": "Long Island Iced Tea"}
         """
         output = {}
-        languages = ['EN', 'ES', 'DE', 'FR', 'ZHHANS', 'ZHHANT']
-        for _l in languages:
+        for code, attr in LANGUAGE_ATTRIBUTES[attribute]:
+            value = getattr(self, attr)
             # skip if entry in language is missing
-            if getattr(self, attribute + _l) is None:
-                continue
-            # for ZH-HANS and ZH-HANT
-            if _l[:2] == 'ZH':
-                output[_l[:2] + '-' + _l[2:]] = getattr(self, attribute + _l)
-            # all other
-            else:
-                output[_l.lower()] = getattr(self, attribute + _l)
+            if value is not None:
+                output[code] = value
         return output
 
     def getInstructions(self) -> Dict[str, str]:
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Tuple, Any, List
+
+import cocktailsearch
+from resources.cache import ResponseCache
+from resources.thecocktaildb import Api
+
+DEFAULT_HOST = '127.0.0.1'  # only local callers
+DEFAULT_PORT = 8080
+MEMO_TTL = 300  # seconds call results are shared between requests before querying again
+MAX_BODY_SIZE = 16 * 1024 * 1024  # max request body bytes
+
+
+class SearchService:
+    """
+    Long-running search service over local HTTP/JSON, keeps the pooled client, cache and catalog warm between requests
+    Endpoints:
+        POST /search - body {"drinks": [...]} as input files, optional "fields" (output keys kept) and "limit" (max
+                       drinks per result), responds {"results": [...]} with one entry per drink:
+                       {"drinks": [...]} formatted results, or {"error": message} if skipped
+        GET /health - responds {"status": "ok"}
+        GET /stats - responds API call and cache counters
+    Bad requests are answered with status 400 and unexpected errors with status 500, both with {"error": message}
+    """
+
+    def __init__(self, api: Api, cache: ResponseCache = None, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 memoTtl: float = MEMO_TTL, fields: List[str] = None, limit: int = None) -> None:
+        """
+        SearchService constructor, binds the port
+        :param api: Api - client shared by every request
+        :param cache: ResponseCache - cache used by api, only for /stats
+        :param host: str - address listened
+        :param port: int - port listened, 0 for any free port
+        :param memoTtl: float - seconds call results are shared between requests
+        :param fields: List[str] - output keys kept when not given by the request, default all
+        :param limit: int - max drinks per result when not given by the request, default all
+        """
+        self._api = api
+        self._fields = fields
+        self._limit = limit
+        self._cache = cache
+        self._memoTtl = memoTtl
+        self._memoCleared = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self._answer('GET', b'')
+
+            def do_POST(self) -> None:
+                size = (self.headers.get('Content-Length') or '0').strip()
+                # not a byte count (negative would read until the client closes)
+                if not size.isdigit():
+                    self._reply(400, {'error': 'Bad request Content-Length ' + size})
+                    return
+                if int(size) > MAX_BODY_SIZE:
+                    self._reply(413, {'error': 'Request body too large'})
+                    return
+                self._answer('POST', self.rfile.read(int(size)))
+
+            def _answer(self, method: str, body: bytes) -> None:
+                try:
+                    status, reply = service.handle(method, self.path, body)
+                # unexpected error, the request still gets an answer and the service keeps running
+                except Exception as e:
+                    status, reply = 500, {'error': 'Internal error ' + type(e).__name__ + ': ' + str(e)}
+                self._reply(status, reply)
+
+            def _reply(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body, separators=(',', ':')).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args) -> None:
+                return
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """
+        Gets the address listened
+        :return: Tuple[str, int] - host, port
+        """
+        return self._httpd.server_address[:2]
+
+    def serve(self) -> None:
+        """
+        Serves requests until shutdown() is called
+        :return: None
+        """
+        self._httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        Stops serving requests
+        :return: None
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """
+        Answers a request
+        :param method: str - GET/POST
+        :param path: str - request path
+        :param body: bytes - request body
+        :return: Tuple[int, Dict[str, Any]] - HTTP status, JSON body
+        """
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/stats':
+            stats = {'requests': self.requests, 'apiCalls': {'requested': self._api.callsRequested,
+                                                              'savedByDeduplication': self._api.callsSaved,
+                                                              'retries': self._api.retries}}
+            if self._cache is not None:
+                stats['cache'] = self._cache.stats()
+            return 200, stats
+        if method == 'POST' and path == '/search':
+            try:
+                request = json.loads(body)
+                drinks = request['drinks']
+                if not isinstance(drinks, list) or not all(isinstance(d, dict) for d in drinks):
+                    raise TypeError('drinks is not a list of drink entries')
+                fields = request.get('fields', self._fields)
+                if fields is not None:
+                    if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+                        raise TypeError('fields is not a list of output keys')
+                    cocktailsearch.projectFields(fields)
+                limit = request.get('limit', self._limit)
+                if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+                    raise TypeError('limit is not a positive integer')
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {'error': 'Bad request ' + str(e)}
+            return self.search(drinks, fields, limit)
+        return 404, {'error': 'Not found'}
+
+    def search(self, drinks: list, fields: List[str] = None, limit: int = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        Searches a batch of drinks
+        :param drinks: list - drink entries
+        :param fields: List[str] - output keys kept, default all
+        :param limit: int - max number of drinks of each result, default all
+        :return: Tuple[int, Dict[str, Any]] - HTTP status, JSON body
+        """
+        with self._lock:
+            self.requests += 1
+            # forget old call results, the cache keeps them with their own TTL
+            if time.monotonic() - self._memoCleared > self._memoTtl:
+                self._api.clearMemo()
+                self._memoCleared = time.monotonic()
+        results = []
+        for kind, value in cocktailsearch.searchChunk(drinks, self._api, fields, limit):
+            if kind == 'result':
+                results.append(value)
+            elif kind == 'error':
+                results.append({'error': value})
+            # HTTP error, bad key
+            else:
+                return 502, {'error': value}
+        return 200, {'results': results}